@@ -1,15 +1,36 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, Response
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, Response, g
 import os
-from datetime import datetime
+from datetime import datetime, date
 from werkzeug.utils import secure_filename
-from image_utils import detect_license_card, detect_license_fields, bytes_to_cv2image, draw_detection_box
-from ocr_utils import extract_text_from_image
-from db_utils import verify_license, add_license, check_admin_password
-import cv2
-import numpy as np
+from image_utils import (detect_card_and_fields_cached, detect_card_and_fields_batched, card_batcher,
+                         detection_cache_stats, crop_fields, detection_full_resolution,
+                         bytes_to_cv2image, upload_buffer)
+from ocr_utils import extract_text_batch
+from card_layout import extract_fields
+from db_utils import verify_license, add_license, check_admin_password, license_cache_stats
+from model_registry import model_stats
+from cache_utils import TTLCache
+from crop_store import CropStore
+from warmup import WARMUP_ON_START, start_warmup, readiness
+from video_pipeline import VideoPipeline
+from motion import MotionGate
+from tracking import CardTracker
+from frame_selection import CaptureWindow
+from jobs import JobQueue
+from workers import INFERENCE_BACKEND, get_inference_pool, stop_inference_pool
+from metrics import (registry, timed, count, begin_request, end_request, server_timing_header,
+                     SamplingProfiler, profiling_requested, cache_collector, REQUEST_SECONDS)
+import json
 import time
+import uuid
+import atexit
 import logging
-from threading import Lock
+from threading import Lock, BoundedSemaphore
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -17,63 +38,206 @@ app.secret_key = 'dev-secret-key-123'  # Use env var in production
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg'}
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
+app.config['KEEP_UPLOADS'] = os.getenv('KEEP_UPLOADS', '0') == '1'  # also store original uploads
+app.config['REDUCED_FRAME_DECODE'] = os.getenv('REDUCED_FRAME_DECODE', '0') == '1'  # half-size /detect_frame decode
+app.config['TIMING_HEADERS'] = os.getenv('TIMING_HEADERS', '0') == '1'  # add Server-Timing to responses
+
+# WebSocket frame channel (needs flask-sock)
+sock = Sock(app) if Sock is not None else None
+ws_inflight = BoundedSemaphore(int(os.getenv('WS_MAX_INFLIGHT', os.cpu_count() or 1)))
 
 # Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Spawned workers re-import this module as __mp_main__; they must not start
+# background threads or warm up
+SPAWNED_WORKER = __name__ == '__mp_main__'
+
 # Globals
 camera_lock = Lock()
-camera = None
+pipeline = None
 last_detection_time = 0
+last_stream_capture = None
 DETECTION_COOLDOWN = 2  # seconds
+STREAM_CAPTURE_TTL = 30  # seconds a stream capture is offered to viewers
+capture_field_boxes = TTLCache(maxsize=256, ttl=600)  # field boxes of live-frame crops by crop key
+
+# Card crops, kept in memory for /verify and written to disk in the background
+crop_store = CropStore()
+if not SPAWNED_WORKER:
+    crop_store.start()
+LICENSE_IMAGE_FOLDER = 'static/licenses'  # crops referenced from the database, never swept
+
+# OCR results keyed by crop key (the content hash of the cropped card)
+ocr_cache = TTLCache(maxsize=256, ttl=600)
+
+# Motion gating: fraction of the scene that must change before YOLO runs, and
+# how often to re-detect while a card stays in view
+MOTION_THRESHOLD = float(os.getenv('MOTION_THRESHOLD', 0.02))
+ACTIVE_DETECTION_INTERVAL = 0.5  # seconds
+frame_gates = TTLCache(maxsize=256, ttl=300)  # one MotionGate per /detect_frame client
+
+# Verification jobs (OCR + DB lookup), at most one per CPU core at a time
+verify_jobs = JobQueue(workers=int(os.getenv('VERIFY_WORKERS', os.cpu_count() or 1)))
+if not SPAWNED_WORKER:
+    verify_jobs.start()
+
+# Steady detections scored before the best one is cropped from the stream
+CAPTURE_WINDOW_SIZE = int(os.getenv('CAPTURE_WINDOW_SIZE', 4))
+
+def new_motion_gate():
+    # The idle refresh also retries a still card that doesn't look card-like to the gate
+    return MotionGate(change_threshold=MOTION_THRESHOLD, active_interval=ACTIVE_DETECTION_INTERVAL,
+                      max_idle_interval=DETECTION_COOLDOWN)
 
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Detection and OCR run in pinned worker processes when INFERENCE_BACKEND=process;
+# the pool is started on first use, never at import
+def card_and_fields_detector(image):
+    pool = get_inference_pool()
+    if pool is not None:
+        return pool.detect_card_and_fields(image)
+    # Batched with the frames of other kiosks and the camera pipeline
+    return detect_card_and_fields_batched(image)
+
+# Load heavy models in the background so pages are served straight away
+if WARMUP_ON_START and not SPAWNED_WORKER:
+    if INFERENCE_BACKEND == 'process':
+        start_warmup({
+            'detector': lambda: get_inference_pool().wait_ready('detection'),
+            'ocr': lambda: get_inference_pool().wait_ready('ocr')
+        })
+    else:
+        start_warmup()
+
+def collect_runtime_metrics():
+    """Batching, job queue and model readiness samples for /metrics"""
+    ready, models = readiness()
+    batching = card_batcher.stats()
+    samples = [
+        ('license_batches_total', 'counter', {}, batching['batches']),
+        ('license_batched_items_total', 'counter', {}, batching['items']),
+        ('license_batch_queue_depth', 'gauge', {}, batching['queued']),
+        ('license_verify_jobs_pending', 'gauge', {}, verify_jobs.pending()),
+    ]
+    samples += [('license_model_ready', 'gauge', {'model': name}, int(status == 'ready'))
+                for name, status in models.items()]
+    return samples
+
+registry.add_collector(cache_collector('licenses', license_cache_stats))
+registry.add_collector(cache_collector('detections_card', lambda: detection_cache_stats()['card']))
+registry.add_collector(cache_collector('detections_card_and_fields',
+                                       lambda: detection_cache_stats()['card_and_fields']))
+registry.add_collector(cache_collector('ocr', ocr_cache.stats))
+registry.add_collector(cache_collector('crops', lambda: crop_store.stats()['memory']))
+registry.add_collector(collect_runtime_metrics)
+
+@app.before_request
+def start_request_timing():
+    g.request_start = time.perf_counter()
+    begin_request()
+    # Send X-Profile: <PROFILE_TOKEN> to sample this one request's stack
+    if profiling_requested(request.headers.get('X-Profile')):
+        g.profiler = SamplingProfiler().start()
+
+@app.after_request
+def finish_request_timing(response):
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    timings = end_request()
+    registry.observe(REQUEST_SECONDS, elapsed, endpoint=request.endpoint or 'unknown',
+                     method=request.method, status=str(response.status_code))
+    if app.config['TIMING_HEADERS']:
+        response.headers['Server-Timing'] = server_timing_header(timings, elapsed)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        path = profiler.stop().save(request.endpoint or 'request')
+        response.headers['X-Profile-Report'] = path
+        logger.info(f"Saved profile of {request.path} to {path}")
+    return response
+
 @app.route('/')
 def home():
     return render_template('index.html')
 
+def session_client_id():
+    """Random id of this browser session, so per-client caches never mix sessions"""
+    if 'client_id' not in session:
+        session['client_id'] = uuid.uuid4().hex
+    return session['client_id']
+
+def save_stream_capture(detection):
+    """Save a card detected by the video pipeline, at most once per cooldown"""
+    global last_detection_time, last_stream_capture
+
+    current_time = time.time()
+    if current_time - last_detection_time <= DETECTION_COOLDOWN:
+        return
+    last_detection_time = current_time
+
+    crop_key = crop_store.put(detection['card'])
+    capture_field_boxes.set(crop_key, {name: field['coordinates']
+                                       for name, field in detection['fields'].items()})
+    last_stream_capture = {
+        'crop_key': crop_key,
+        'confidence': float(detection['confidence']),
+        'time': current_time
+    }
+
+@app.route('/stream_capture')
+def stream_capture():
+    """
+    Latest card captured from the live stream, offered only to a viewer of
+    the detect page opened before the capture and only for STREAM_CAPTURE_TTL
+    """
+    capture = last_stream_capture
+    since = session.get('stream_since', time.time())
+    if capture is None or capture['time'] < since or time.time() - capture['time'] > STREAM_CAPTURE_TTL:
+        return jsonify({'status': 'success', 'detected': False})
+    return jsonify({
+        'status': 'success',
+        'detected': True,
+        'confidence': capture['confidence'],
+        'crop_key': capture['crop_key'],
+        'cropped_image': url_for('crop_image', key=capture['crop_key'])
+    })
+
+def get_pipeline():
+    """
+    Return the running camera pipeline, starting it if nobody was watching
+    Call with camera_lock held
+    """
+    global pipeline
+    if pipeline is None or not pipeline.running:
+        if pipeline is not None:
+            # e.g. capture stopped after a failed read; free the camera before reopening it
+            pipeline.stop()
+        pipeline = VideoPipeline(0, 1280, 720, on_detection=save_stream_capture,
+                                 gate=new_motion_gate(), tracker=CardTracker(),
+                                 capture_window=CaptureWindow(CAPTURE_WINDOW_SIZE),
+                                 detector=card_and_fields_detector).start()
+    return pipeline
+
 @app.route('/video_feed')
 def video_feed():
-    """Video streaming with real-time detection"""
-    def generate():
-        global camera, last_detection_time
-
-        with camera_lock:
-            if camera is None:
-                camera = cv2.VideoCapture(0)
-                camera.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-                camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-
-        while True:
-            success, frame = camera.read()
-            if not success:
-                break
+    """Video streaming with real-time detection; the camera only runs while someone watches"""
+    with camera_lock:
+        stream = get_pipeline()
+        client = stream.subscribe()
 
-            current_time = time.time()
-            processed_frame = frame.copy()
-
-            if current_time - last_detection_time > DETECTION_COOLDOWN:
-                try:
-                    cropped_img, confidence, box = detect_license_card(frame)
-                    if cropped_img is not None and confidence > 0.93:
-                        last_detection_time = current_time
-                        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-                        cropped_filename = f"cropped_{timestamp}.jpg"
-                        cropped_path = os.path.join(app.config['UPLOAD_FOLDER'], cropped_filename)
-                        cv2.imwrite(cropped_path, cropped_img)
-                        session['cropped_image'] = cropped_path
-                        processed_frame = draw_detection_box(processed_frame, box, confidence)
-                except Exception as e:
-                    logger.error(f"Detection error: {e}")
-
-            ret, buffer = cv2.imencode('.jpg', processed_frame)
-            frame_bytes = buffer.tobytes()
-
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+    def generate():
+        try:
+            for frame_bytes in stream.frames(client):
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        finally:
+            # Release the camera and stop inference once the last viewer has left
+            with camera_lock:
+                stream.unsubscribe(client)
+                if stream.viewer_count() == 0:
+                    stream.stop()
 
     return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
@@ -90,30 +254,41 @@ def detect():
         if file and allowed_file(file.filename):
             try:
                 filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-
-                img = cv2.imread(filepath)
-                cropped_img, confidence, _ = detect_license_card(img)
-
-                if cropped_img is not None and confidence > 0.93:
-                    cropped_filename = f"cropped_{filename}"
-                    cropped_path = os.path.join(app.config['UPLOAD_FOLDER'], cropped_filename)
-                    cv2.imwrite(cropped_path, cropped_img)
-                    session['cropped_image'] = cropped_path
+                buffer = upload_buffer(file)
+                if app.config['KEEP_UPLOADS']:
+                    with open(os.path.join(app.config['UPLOAD_FOLDER'], filename), 'wb') as f:
+                        f.write(buffer)
+
+                img = bytes_to_cv2image(buffer)
+                detection = detect_card_and_fields_cached(img, detector=card_and_fields_detector,
+                                                          client=session_client_id())
+
+                if detection is not None:
+                    cropped_img = detection['card']
+                    confidence = detection['confidence']
+                    crop_key = crop_store.put(cropped_img)
+                    session['crop_key'] = crop_key
+                    # Remember field boxes so /verify doesn't run the detector again
+                    session['field_boxes'] = {
+                        name: field['coordinates'] for name, field in detection['fields'].items()
+                    }
 
                     return jsonify({
                         'status': 'success',
-                        'cropped_image': url_for('static', filename=f'uploads/{cropped_filename}'),
+                        'cropped_image': url_for('crop_image', key=crop_key),
                         'confidence': float(confidence)
                     })
                 else:
                     return jsonify({'status': 'error', 'message': 'Low confidence'}), 400
 
+            except ValueError as e:
+                return jsonify({'status': 'error', 'message': str(e)}), 400
             except Exception as e:
                 logger.error(f"Image processing error: {e}")
                 return jsonify({'status': 'error', 'message': 'Processing failed'}), 500
 
+    # Only stream captures made while this page is open are offered to it
+    session['stream_since'] = time.time()
     return render_template('detect.html')
 
 @app.route('/detect_frame', methods=['POST'])
@@ -122,82 +297,299 @@ def detect_frame():
         return jsonify({'status': 'error', 'message': 'No frame provided'}), 400
 
     try:
-        frame = request.files['frame']
-        img = bytes_to_cv2image(frame.read())
-
-        cropped_img, confidence, box = detect_license_card(img)
-        if cropped_img is not None and confidence > 0.93:
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            cropped_filename = f"cropped_{timestamp}.jpg"
-            cropped_path = os.path.join(app.config['UPLOAD_FOLDER'], cropped_filename)
-            cv2.imwrite(cropped_path, cropped_img)
-
-            return jsonify({
-                'status': 'success',
-                'detected': True,
-                'confidence': float(confidence),
-                'cropped_image': url_for('static', filename=f'uploads/{cropped_filename}'),
-                'image_path': cropped_path
-            })
-
-        return jsonify({'status': 'success', 'detected': False})
-
+        buffer = upload_buffer(request.files['frame'])
+        # Clients behind one address (e.g. kiosks behind NAT) must not share a
+        # gate, or one would be replayed another's detection and crop
+        client_id = request.form.get('client_id') or session_client_id()
+        gate = frame_gates.get(client_id)
+        if gate is None:
+            gate = new_motion_gate()
+            frame_gates.set(client_id, gate)
+
+        if request.form.get('still') == '1':
+            return jsonify(detect_still(bytes_to_cv2image(buffer), gate))
+
+        img = bytes_to_cv2image(buffer, reduced=app.config['REDUCED_FRAME_DECODE'])
+        # Detection runs on the half-size decode, the crop is taken at full resolution
+        load_full = (lambda: bytes_to_cv2image(buffer)) if app.config['REDUCED_FRAME_DECODE'] else None
+        # Clients sending downscaled frames ask for a full-resolution still instead
+        want_still = request.form.get('stills') == '1'
+        return jsonify(detect_in_frame(img, gate, client_id, load_full, want_still))
+
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         logger.error(f"Frame detection error: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def detect_in_frame(img, gate, client, load_full=None, want_still=False):
+    """
+    Detect the card in one live frame for /detect_frame and /ws/frames
+    load_full returns the frame at full resolution when img is a reduced decode
+    With want_still (the client sent a downscaled frame), a card is not cropped
+    from the frame; the reply asks for a full-resolution still (see detect_still)
+    """
+    # Skip YOLO when this client's scene hasn't changed since its last detection
+    if not gate.should_detect(img):
+        return gate.last_result or {'status': 'success', 'detected': False}
+
+    # Misses are batched with other kiosks' frames (or sent to the detection worker);
+    # the single pass also finds the fields, so /verify needs no second detector run
+    detection = detect_card_and_fields_cached(img, detector=card_and_fields_detector, client=client)
+    if detection is not None and detection['confidence'] > 0.93:
+        if want_still:
+            result = {'status': 'success', 'detected': False, 'send_still': True}
+        else:
+            if load_full is not None:
+                detection = detection_full_resolution(load_full(), img, detection)
+            result = store_live_detection(detection)
+        gate.report(True, result)
+        return result
+
+    result = {'status': 'success', 'detected': False}
+    gate.report(False, result)
+    return result
+
+def detect_still(img, gate):
+    """
+    Detect and crop the card in the full-resolution still a client sends
+    after a send_still reply, so /verify never OCRs a downscaled frame
+    """
+    # Not cached: the still hashes like the downscaled frame but its boxes don't match
+    detection = card_and_fields_detector(img)
+    if detection is not None and detection['confidence'] > 0.93:
+        result = store_live_detection(detection)
+        gate.report(True, result)
+        return result
+    result = {'status': 'success', 'detected': False}
+    gate.report(False, result)
+    return result
+
+def store_live_detection(detection):
+    """Store a live detection's crop and field boxes; returns the positive reply"""
+    crop_key = crop_store.put(detection['card'])
+    capture_field_boxes.set(crop_key, {name: field['coordinates']
+                                       for name, field in detection['fields'].items()})
+    return {
+        'status': 'success',
+        'detected': True,
+        'confidence': float(detection['confidence']),
+        'box': [int(v) for v in detection['box']],
+        'cropped_image': url_for('crop_image', key=crop_key),
+        'crop_key': crop_key,
+        'image_path': crop_store.path(crop_key)
+    }
+
+if sock is None:
+    logger.info("flask-sock is not installed, /ws/frames is disabled")
+else:
+    @sock.route('/ws/frames')
+    def frame_socket(ws):
+        """
+        Persistent channel for live frames: the client sends binary JPEG
+        frames (already downscaled) and gets one JSON reply per processed frame
+        When a card is found the reply has send_still set, and the client's
+        next frame is a full-resolution still the card is cropped from
+        Frames that arrive while the previous one is still being processed are
+        dropped in favour of the newest, and frames are rejected with a 'busy'
+        reply when WS_MAX_INFLIGHT frames are already being processed server-wide
+        """
+        gate = new_motion_gate()
+        client = uuid.uuid4().hex
+        seq = 0
+        awaiting_still = False
+        while True:
+            message = ws.receive()
+            if message is None:
+                break
+            # Keep only the newest frame the client has sent meanwhile
+            dropped = 0
+            while True:
+                newer = ws.receive(timeout=0)
+                if newer is None:
+                    break
+                message = newer
+                dropped += 1
+            if dropped:
+                count('ws_frames_dropped', amount=dropped, reason='superseded')
+            if isinstance(message, str):
+                continue  # no text commands yet
+            seq += 1
+
+            if not ws_inflight.acquire(blocking=False):
+                count('ws_frames_dropped', reason='busy')
+                ws.send(json.dumps({'status': 'busy', 'seq': seq, 'dropped': dropped}))
+                continue
+            try:
+                image = bytes_to_cv2image(message)
+                if awaiting_still:
+                    result = detect_still(image, gate)
+                else:
+                    result = detect_in_frame(image, gate, client, want_still=True)
+                awaiting_still = bool(result.get('send_still'))
+            except Exception as e:
+                logger.error(f"WebSocket frame error: {e}")
+                result = {'status': 'error', 'message': str(e)}
+            finally:
+                ws_inflight.release()
+            ws.send(json.dumps(dict(result, seq=seq, dropped=dropped)))
+
 @app.route('/verify', methods=['GET', 'POST'])
 def verify():
-    if 'cropped_image' not in session:
+    # Crops detected over the WebSocket or the live stream are handed over
+    # by key, since neither can write to the session
+    crop_key = request.args.get('crop')
+    if crop_key and crop_store.get(crop_key) is not None:
+        session['crop_key'] = crop_key
+        field_boxes = capture_field_boxes.get(crop_key)
+        if field_boxes:
+            session['field_boxes'] = field_boxes
+        else:
+            session.pop('field_boxes', None)
+
+    if 'crop_key' not in session:
         return redirect(url_for('detect'))
 
-    cropped_path = session['cropped_image']
+    crop_key = session['crop_key']
 
     if request.method == 'POST':
-        try:
-            img = cv2.imread(cropped_path)
-            fields = detect_license_fields(img)
-
-            license_data = {}
-            for field_name, field_info in fields.items():
-                text = extract_text_from_image(field_info['image'])
-                license_data[field_name] = text
+        # OCR and the DB lookup run on the job workers; the client follows the
+        # job through /verify/status/<id> or the /verify/events/<id> stream
+        for key in ('license_data', 'is_valid', 'exists_in_db', 'db_details'):
+            session.pop(key, None)
+        job_id = verify_jobs.submit(run_verification, crop_key, session.get('field_boxes'))
+        session['verify_job'] = job_id
+        return jsonify({
+            'status': 'queued',
+            'job_id': job_id,
+            'status_url': url_for('verify_status', job_id=job_id),
+            'events_url': url_for('verify_events', job_id=job_id)
+        }), 202
+
+    return render_template('verify.html', cropped_image=url_for('crop_image', key=crop_key))
+
+def run_verification(crop_key, field_boxes):
+    """
+    Extract the card fields with OCR and check them against the database
+    Runs on a job worker, so it must not touch the session
+    """
+    license_data = ocr_cache.get(crop_key)
+
+    if license_data is None:
+        # Usually still in memory; only crops from an earlier process are read back
+        with timed('crop_read'):
+            img = crop_store.get(crop_key)
+        if img is None:
+            raise ValueError("Card image is no longer available, please capture it again")
+        pool = get_inference_pool()
+        if pool is not None:
+            ocr_results = pool.read_fields(img, field_boxes)
+        else:
+            if field_boxes:
+                fields = crop_fields(img, field_boxes)
+            else:
+                # Warp the card to its canonical shape; known layouts skip the field detector
+                fields, method = extract_fields(img)
+                logger.info(f"Located fields of crop {crop_key} with the {method}")
+
+            ocr_results = extract_text_batch(
+                {field_name: field_info['image'] for field_name, field_info in fields.items()})
+        license_data = {field_name: result['text'] for field_name, result in ocr_results.items()}
+        ocr_cache.set(crop_key, license_data)
+    else:
+        license_data = dict(license_data)
+
+    valid_till = license_data.get('valid_till', '')
+    exists_in_db, db_details = verify_license(
+        license_data.get('dl_number', ''),
+        license_data.get('name', ''),
+        valid_till
+    )
+
+    # The stored expiry is authoritative; the OCR'd one may be off by a digit
+    expiry = db_details['valid_till'] if exists_in_db else valid_till
+    try:
+        if not isinstance(expiry, date):
+            expiry = datetime.strptime(str(expiry), '%Y-%m-%d').date()
+        elif isinstance(expiry, datetime):
+            expiry = expiry.date()
+        is_valid = expiry >= datetime.now().date()
+    except ValueError:
+        is_valid = False
+
+    return {
+        'license_data': license_data,
+        'is_valid': is_valid,
+        'exists_in_db': exists_in_db,
+        'db_details': db_details
+    }
+
+def job_response(job):
+    """JSON body describing a verification job, as returned by /verify before"""
+    if job['status'] == 'done':
+        result = job['result']
+        return {
+            'status': 'success',
+            'job_status': 'done',
+            'license_data': result['license_data'],
+            'is_valid': result['is_valid'],
+            'exists_in_db': result['exists_in_db']
+        }
+    if job['status'] == 'failed':
+        return {'status': 'error', 'job_status': 'failed', 'message': 'Verification failed'}
+    return {'status': 'pending', 'job_status': job['status']}
+
+def apply_job_result(job_id):
+    """Copy a finished verification job's result into the session"""
+    job = verify_jobs.get(job_id)
+    if job is None or job['status'] != 'done':
+        return job
+
+    result = job['result']
+    session['license_data'] = result['license_data']
+    session['is_valid'] = result['is_valid']
+    session['exists_in_db'] = result['exists_in_db']
+    session['db_details'] = result['db_details']
+    return job
+
+@app.route('/verify/status/<job_id>')
+def verify_status(job_id):
+    job = apply_job_result(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Unknown job'}), 404
+    return jsonify(job_response(job))
+
+@app.route('/verify/events/<job_id>')
+def verify_events(job_id):
+    """Server-sent events stream of a verification job's progress"""
+    if verify_jobs.get(job_id) is None:
+        return jsonify({'status': 'error', 'message': 'Unknown job'}), 404
 
-            valid_till = license_data.get('valid_till', '')
-            is_valid = True
-            try:
-                valid_date = datetime.strptime(valid_till, '%Y-%m-%d').date()
-                if valid_date < datetime.now().date():
-                    is_valid = False
-            except:
-                is_valid = False
-
-            exists_in_db, db_details = verify_license(
-                license_data.get('dl_number', ''),
-                license_data.get('name', ''),
-                valid_till
-            )
-
-            session['license_data'] = license_data
-            session['is_valid'] = is_valid
-            session['exists_in_db'] = exists_in_db
-            session['db_details'] = db_details
-
-            return jsonify({
-                'status': 'success',
-                'license_data': license_data,
-                'is_valid': is_valid,
-                'exists_in_db': exists_in_db
-            })
-
-        except Exception as e:
-            logger.error(f"Verification error: {e}")
-            return jsonify({'status': 'error', 'message': 'Verification failed'}), 500
-
-    return render_template('verify.html', cropped_image=os.path.basename(cropped_path))
+    def generate():
+        last_status = None
+        while True:
+            job = verify_jobs.wait(job_id, last_status)
+            if job is None:
+                yield 'event: error\ndata: {"message": "Unknown job"}\n\n'
+                return
+            if job['status'] == last_status:
+                # Keep the connection alive while the job is still queued or running
+                yield ': keep-alive\n\n'
+                continue
+            last_status = job['status']
+            yield f"event: {last_status}\ndata: {json.dumps(job_response(job))}\n\n"
+            if last_status in ('done', 'failed'):
+                return
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/result')
 def result():
+    if 'license_data' not in session and 'verify_job' in session:
+        # Clients that followed the event stream haven't stored the result yet
+        apply_job_result(session['verify_job'])
+
     if 'license_data' not in session:
         return redirect(url_for('home'))
 
@@ -227,33 +619,71 @@ def admin():
 
         if valid:
             license_data = session.get('license_data', {})
-            cropped_path = session.get('cropped_image', '')
-
-            if license_data and cropped_path:
+            crop_key = session.get('crop_key', '')
+            # Copied out of the crop store, whose retention would delete it;
+            # a copy another record already uses is never removed here
+            image_path = None
+            if license_data and crop_key:
+                already_kept = os.path.exists(os.path.join(LICENSE_IMAGE_FOLDER, crop_store.filename(crop_key)))
+                image_path = crop_store.keep(crop_key, LICENSE_IMAGE_FOLDER)
+
+            if image_path:
                 success, db_message = add_license(
                     license_data.get('dl_number', ''),
                     license_data.get('name', ''),
                     license_data.get('valid_till', ''),
-                    cropped_path
+                    image_path
                 )
 
                 if success:
                     session['exists_in_db'] = True
                     return jsonify({'status': 'success'})
 
+                # Nothing references the copy, and retention never sweeps this folder
+                if not already_kept:
+                    os.remove(image_path)
                 return jsonify({'status': 'error', 'message': db_message}), 400
 
         return jsonify({'status': 'error', 'message': message}), 401
 
     return render_template('admin.html')
 
-@app.teardown_appcontext
-def teardown_camera(exception):
-    global camera
+@app.route('/healthz')
+def healthz():
+    """Readiness probe reporting which models have finished warming up"""
+    ready, models = readiness()
+    return jsonify({
+        'status': 'ready' if ready else 'starting',
+        'models': models,
+        'stats': model_stats(),
+        'caches': {
+            'licenses': license_cache_stats(),
+            'detections': detection_cache_stats(),
+            'ocr': ocr_cache.stats(),
+            'crops': crop_store.stats()
+        },
+        'batching': card_batcher.stats()
+    }), 200 if ready else 503
+
+@app.route('/crops/<key>.jpg')
+def crop_image(key):
+    """Serve a stored crop, from memory if the writer hasn't reached it yet"""
+    data = crop_store.encoded(key)
+    if data is None:
+        return jsonify({'status': 'error', 'message': 'Crop not found'}), 404
+    return Response(data, mimetype='image/jpeg', headers={'Cache-Control': 'private, max-age=3600'})
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@atexit.register
+def shutdown_camera():
     with camera_lock:
-        if camera is not None:
-            camera.release()
-            camera = None
+        if pipeline is not None:
+            pipeline.stop()
+    stop_inference_pool()
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
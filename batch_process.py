@@ -0,0 +1,208 @@
+import os
+import glob
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
+import cv2
+from image_utils import detect_card_and_fields
+from ocr_utils import extract_text_batch
+from card_layout import extract_fields
+from workers import get_inference_pool
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+PROGRESS_EVERY = 100  # log throughput every this many results
+
+# In-process, image_utils and ocr_utils serialize calls into the shared YOLO and
+# PaddleOCR models, so one image is detected and one read at a time while
+# decoding and the other stage of other images overlap with them
+
+def _image_source(path):
+    return path, lambda: cv2.imread(path)
+
+def _iter_video(path, stride):
+    """Yield (source id, loader) for every stride-th frame of a video"""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        logger.error(f"Could not open video {path}")
+        return
+    index = 0
+    try:
+        while True:
+            # grab() skips frames without decoding them
+            if not cap.grab():
+                break
+            if index % stride == 0:
+                ok, frame = cap.retrieve()
+                if ok:
+                    yield f"{path}#frame={index}", (lambda frame=frame: frame)
+            index += 1
+    finally:
+        cap.release()
+
+def iter_sources(inputs, video_stride=1):
+    """
+    Lazily expand directories, glob patterns, image and video files into
+    (source id, loader) pairs; loader() returns the decoded BGR image
+    """
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield _image_source(os.path.join(root, name))
+        elif item.lower().endswith(VIDEO_EXTENSIONS) and os.path.isfile(item):
+            yield from _iter_video(item, video_stride)
+        elif os.path.isfile(item):
+            yield _image_source(item)
+        else:
+            matches = sorted(glob.glob(item, recursive=True))
+            if not matches:
+                logger.warning(f"No files match {item}")
+            for path in matches:
+                if path.lower().endswith(VIDEO_EXTENSIONS):
+                    yield from _iter_video(path, video_stride)
+                elif path.lower().endswith(IMAGE_EXTENSIONS):
+                    yield _image_source(path)
+
+def completed_sources(output_path):
+    """Source ids already written to a JSONL results file; failed ones are retried"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if record.get('status') != 'error':
+                    done.add(record['source'])
+            except (ValueError, KeyError, AttributeError):
+                continue  # e.g. a line cut short when the previous run was killed
+    return done
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+def process_image(source, load, verify=False, pool=None):
+    """Run decode -> detect -> fields -> OCR (-> DB verify) on one image"""
+    start = time.perf_counter()
+    record = {'source': source, 'status': 'ok'}
+    try:
+        image = load()
+        if image is None:
+            raise ValueError("could not decode image")
+
+        if pool is not None:
+            detection = pool.detect_card_and_fields(image)
+        else:
+            detection = detect_card_and_fields(image)
+        if detection is None:
+            record['status'] = 'no_card'
+            return record
+
+        record['confidence'] = round(float(detection['confidence']), 4)
+        record['box'] = list(detection['box'])
+        field_boxes = {name: field['coordinates'] for name, field in detection['fields'].items()}
+        if pool is not None:
+            ocr_results = pool.read_fields(detection['card'], field_boxes or None)
+        else:
+            fields = detection['fields'] or extract_fields(detection['card'])[0]
+            ocr_results = extract_text_batch({name: field['image'] for name, field in fields.items()})
+        record['fields'] = {name: result['text'] for name, result in ocr_results.items()}
+        record['field_confidence'] = {name: round(result['confidence'], 4)
+                                      for name, result in ocr_results.items()}
+
+        if verify:
+            from db_utils import verify_license
+            exists, _ = verify_license(record['fields'].get('dl_number', ''),
+                                       record['fields'].get('name', ''),
+                                       record['fields'].get('valid_till', ''))
+            record['exists_in_db'] = exists
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = str(e)
+    finally:
+        record['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return record
+
+def run(inputs, output_path, workers=None, max_in_flight=None, verify=False,
+        video_stride=1, resume=True):
+    """
+    Stream every source through a bounded worker pool, appending one JSON
+    line per result as soon as it completes
+    At most max_in_flight decoded images are held in memory at any time
+    Returns dict of counts per status
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    done = completed_sources(output_path) if resume else set()
+    if done:
+        logger.info(f"Resuming: {len(done)} sources already in {output_path}")
+    pool = get_inference_pool()
+
+    counts = {}
+    started = time.perf_counter()
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    with open(output_path, 'a' if resume else 'w') as out, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch') as executor:
+        if out.tell() and not _ends_with_newline(output_path):
+            out.write('\n')  # start after a line the previous run left unfinished
+
+        def drain(pending, return_when):
+            finished, pending = wait(pending, return_when=return_when)
+            for future in finished:
+                record = future.result()
+                out.write(json.dumps(record) + '\n')
+                counts[record['status']] = counts.get(record['status'], 0) + 1
+                total = sum(counts.values())
+                if total % PROGRESS_EVERY == 0:
+                    rate = total / (time.perf_counter() - started)
+                    logger.info(f"{total} processed ({rate:.1f}/s) {counts}")
+            out.flush()
+            return pending
+
+        pending = set()
+        try:
+            for source, load in iter_sources(inputs, video_stride):
+                if source in done:
+                    continue
+                if len(pending) >= max_in_flight:
+                    pending = drain(pending, FIRST_COMPLETED)
+                pending.add(executor.submit(process_image, source, load, verify, pool))
+        except KeyboardInterrupt:
+            logger.warning("Interrupted, finishing in-flight images; rerun to resume")
+        drain(pending, ALL_COMPLETED)
+
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    logger.info(f"Done: {total} images in {elapsed:.1f}s "
+                f"({total / elapsed if elapsed else 0:.1f}/s) {counts}")
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Extract license fields from directories, globs or video files into JSONL')
+    parser.add_argument('inputs', nargs='+', help='directories, image/video files or glob patterns')
+    parser.add_argument('-o', '--output', default='batch_results.jsonl',
+                        help='JSONL results file, resumed when it exists')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker threads (default: cores)')
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help='images decoded ahead of the workers (default: 2 x workers)')
+    parser.add_argument('--verify', action='store_true', help='check each card against the database')
+    parser.add_argument('--video-stride', type=int, default=15, help='process every Nth video frame')
+    parser.add_argument('--no-resume', action='store_true', help='overwrite the output instead of resuming')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    run(args.inputs, args.output, args.workers, args.max_in_flight, args.verify,
+        max(args.video_stride, 1), not args.no_resume)
+
+if __name__ == '__main__':
+    main()
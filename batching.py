@@ -0,0 +1,91 @@
+import os
+import time
+import queue
+import logging
+from concurrent.futures import Future
+from threading import Thread, Lock
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the detection micro-batcher
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 8))
+MAX_BATCH_LATENCY = float(os.getenv('MAX_BATCH_LATENCY_MS', 10)) / 1000  # seconds
+
+class BatchScheduler:
+    """
+    Dynamic micro-batcher: requests from many threads are gathered for up to
+    max_latency seconds (or until max_batch items arrive) and handed to
+    batch_fn as one list. batch_fn must return one result per item, in order.
+    """
+
+    def __init__(self, batch_fn, max_batch=MAX_BATCH_SIZE, max_latency=MAX_BATCH_LATENCY):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = Lock()
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name='batch-scheduler', daemon=True)
+                self._thread.start()
+
+    def submit(self, item):
+        """Queue an item and return a Future for its result"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item, timeout=None):
+        """Submit an item and wait for its result"""
+        return self.submit(item).result(timeout)
+
+    def _collect(self):
+        """Block for the first item, then gather more until the batch is full or stale"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Drop requests whose callers already cancelled them
+            batch = [(item, future) for item, future in self._collect()
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            items = [item for item, future in batch]
+            futures = [future for item, future in batch]
+
+            try:
+                results = self.batch_fn(items)
+            except Exception as e:
+                logger.error(f"Batch of {len(items)} failed: {e}")
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(items)
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch_size': round(self.items / self.batches, 2) if self.batches else 0.0,
+            'queued': self._queue.qsize(),
+        }
@@ -0,0 +1,337 @@
+import os
+import ast
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+import platform
+import resource
+from datetime import datetime
+import cv2
+import numpy as np
+from model_registry import get_yolo, model_stats, DEFAULT_VARIANT
+from image_utils import (detect_license_card, detect_license_fields, detect_card_and_fields,
+                         predict_boxes, resolve_class_ids, warm_up, CLASS_ALIASES, DETECT_IMGSZ,
+                         RECTIFY_CARD)
+from ocr_utils import extract_text_from_image, extract_text_batch
+from card_layout import extract_fields, card_warp
+import ocr_utils
+
+logger = logging.getLogger(__name__)
+
+DATASET_DIR = 'datasets'
+DEFAULT_SPLITS = ['valid', 'test']
+RESULTS_DIR = 'benchmarks'
+IOU_THRESHOLD = 0.5
+EVAL_CONFIDENCE = 0.25  # predictions kept for mAP; the app's own thresholds are higher
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def load_class_names(dataset_dir=DATASET_DIR):
+    """Read the class names from data.yaml, mapped to the names used in the code"""
+    with open(os.path.join(dataset_dir, 'data.yaml')) as f:
+        for line in f:
+            if line.startswith('names:'):
+                names = ast.literal_eval(line.split(':', 1)[1].strip())
+                return [CLASS_ALIASES.get(name.lower(), name) for name in names]
+    raise ValueError("data.yaml has no names entry")
+
+def load_split(split, names, dataset_dir=DATASET_DIR):
+    """
+    List the images of a split with their ground truth boxes
+    Returns list of (image path, [(class name, (x1, y1, x2, y2)), ...]) in pixels
+    """
+    image_dir = os.path.join(dataset_dir, split, 'images')
+    label_dir = os.path.join(dataset_dir, split, 'labels')
+    samples = []
+    for path in sorted(glob.glob(os.path.join(image_dir, '*'))):
+        if not path.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        label_path = os.path.join(label_dir, os.path.splitext(os.path.basename(path))[0] + '.txt')
+        image = cv2.imread(path)
+        if image is None:
+            logger.warning(f"Skipping unreadable image {path}")
+            continue
+        height, width = image.shape[:2]
+        boxes = []
+        if os.path.exists(label_path):
+            with open(label_path) as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) < 5:
+                        continue
+                    cx, cy, w, h = (float(v) for v in parts[1:5])
+                    boxes.append((names[int(parts[0])], (
+                        int((cx - w / 2) * width), int((cy - h / 2) * height),
+                        int((cx + w / 2) * width), int((cy + h / 2) * height))))
+        samples.append((path, boxes))
+    return samples
+
+def box_iou(a, b):
+    """Intersection over union of two (x1, y1, x2, y2) boxes"""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(ix2 - ix1, 0) * max(iy2 - iy1, 0)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def average_precision(predictions, num_truths):
+    """
+    All-point interpolated AP from (confidence, is_true_positive) pairs
+    """
+    if num_truths == 0:
+        return None
+    if not predictions:
+        return 0.0
+    predictions = sorted(predictions, key=lambda p: -p[0])
+    hits = np.array([tp for _, tp in predictions], dtype=np.float64)
+    tp = np.cumsum(hits)
+    fp = np.cumsum(1 - hits)
+    recall = tp / num_truths
+    precision = tp / np.maximum(tp + fp, 1e-9)
+    # Make precision monotonically decreasing, then integrate over recall
+    recall = np.concatenate(([0.0], recall, [1.0]))
+    precision = np.concatenate(([0.0], precision, [0.0]))
+    for i in range(len(precision) - 2, -1, -1):
+        precision[i] = max(precision[i], precision[i + 1])
+    steps = np.where(recall[1:] != recall[:-1])[0]
+    return float(np.sum((recall[steps + 1] - recall[steps]) * precision[steps + 1]))
+
+def match_predictions(predictions, truths):
+    """
+    Greedily match (confidence, box) predictions to truth boxes of one class
+    Returns list of (confidence, is_true_positive)
+    """
+    matched = set()
+    scored = []
+    for confidence, box in sorted(predictions, key=lambda p: -p[0]):
+        best, best_iou = None, IOU_THRESHOLD
+        for i, truth in enumerate(truths):
+            iou = box_iou(box, truth)
+            if i not in matched and iou >= best_iou:
+                best, best_iou = i, iou
+        if best is not None:
+            matched.add(best)
+        scored.append((confidence, best is not None))
+    return scored
+
+class StageTimer:
+    """Collects wall-clock latencies per pipeline stage"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def time(self, stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.samples.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    def summary(self):
+        summary = {}
+        for stage, samples in self.samples.items():
+            ms = np.array(samples) * 1000
+            summary[stage] = {
+                'count': len(samples),
+                'p50_ms': round(float(np.percentile(ms, 50)), 2),
+                'p95_ms': round(float(np.percentile(ms, 95)), 2),
+                'p99_ms': round(float(np.percentile(ms, 99)), 2),
+                'mean_ms': round(float(ms.mean()), 2),
+                'per_second': round(len(samples) / float(ms.sum() / 1000), 2) if ms.sum() else 0.0,
+            }
+        return summary
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # kilobytes on Linux
+
+def warp_box(box, warp):
+    """Bounding box of an (x1, y1, x2, y2) box after a perspective warp"""
+    x1, y1, x2, y2 = box
+    corners = np.array([[[x1, y1], [x2, y1], [x2, y2], [x1, y2]]], dtype=np.float32)
+    warped = cv2.perspectiveTransform(corners, warp)[0]
+    return (*warped.min(axis=0), *warped.max(axis=0))
+
+def evaluate_map(samples, names):
+    """
+    Detection AP@0.5 per class from one low-threshold predict per image,
+    resized like the app's detector (DETECT_IMGSZ) so the numbers match it
+    """
+    model = get_yolo()
+    card_class, field_classes = resolve_class_ids(model)
+    class_names = dict(field_classes, **{card_class: 'license_card'})
+    predictions = {name: [] for name in names}
+    truths_per_class = {name: 0 for name in names}
+
+    for path, truths in samples:
+        per_class = {}
+        for cls, confidence, box in predict_boxes(cv2.imread(path), EVAL_CONFIDENCE):
+            name = class_names.get(cls)
+            if name is not None:
+                per_class.setdefault(name, []).append((confidence, box))
+        for name in names:
+            class_truths = [box for label, box in truths if label == name]
+            truths_per_class[name] += len(class_truths)
+            predictions[name].extend(match_predictions(per_class.get(name, []), class_truths))
+
+    ap = {name: average_precision(predictions[name], truths_per_class[name]) for name in names}
+    scored = [value for value in ap.values() if value is not None]
+    return {
+        'ap50': {name: None if value is None else round(value, 4) for name, value in ap.items()},
+        'map50': round(float(np.mean(scored)), 4) if scored else None,
+    }
+
+def run_stages(samples, timer, verify=False):
+    """
+    Time each stage on every image and measure card and field recall
+    The detector returns one card per image, so card recall counts images
+    with a card whose detection matches one of them. Field recall is measured
+    on the ground-truth card crop, so it reflects the field stage alone
+    """
+    counts = {'card_images': 0, 'cards_found': 0, 'fields': 0, 'fields_found': 0,
+              'layout_fields': 0, 'layout_fields_found': 0}
+
+    for path, truths in samples:
+        image = timer.time('decode', cv2.imread, path)
+        cards = [box for label, box in truths if label == 'license_card']
+        fields = [(label, box) for label, box in truths if label != 'license_card']
+
+        _, _, box = timer.time('detect_license_card', detect_license_card, image)
+        counts['card_images'] += 1 if cards else 0
+        if cards and any(box_iou(box, card) >= IOU_THRESHOLD for card in cards):
+            counts['cards_found'] += 1
+
+        for cx1, cy1, cx2, cy2 in cards[:1]:
+            card = image[cy1:cy2, cx1:cx2]
+            inside = [(label, (x1 - cx1, y1 - cy1, x2 - cx1, y2 - cy1))
+                      for label, (x1, y1, x2, y2) in fields
+                      if cx1 <= (x1 + x2) / 2 <= cx2 and cy1 <= (y1 + y2) / 2 <= cy2]
+            detected = timer.time('detect_license_fields', detect_license_fields, card)
+            counts['fields'] += len(inside)
+            counts['fields_found'] += sum(
+                1 for label, truth in inside
+                if label in detected and box_iou(detected[label]['coordinates'], truth) >= IOU_THRESHOLD)
+
+            # Layout fields live on the warped card; warp the truth boxes the same way
+            located, method = timer.time('extract_fields', extract_fields, card)
+            warp = card_warp(card) if method == 'layout' else None
+            if warp is not None:
+                counts['layout_fields'] += len(inside)
+                counts['layout_fields_found'] += sum(
+                    1 for label, truth in inside
+                    if label in located
+                    and box_iou(located[label]['coordinates'], warp_box(truth, warp)) >= IOU_THRESHOLD)
+
+            for field in detected.values():
+                if field['image'].size:
+                    timer.time('extract_text_from_image', extract_text_from_image, field['image'])
+
+        timer.time('detect_to_verify', detect_to_verify, image, verify)
+
+    return {
+        'card_recall': round(counts['cards_found'] / counts['card_images'], 4) if counts['card_images'] else None,
+        'field_recall': round(counts['fields_found'] / counts['fields'], 4) if counts['fields'] else None,
+        'layout_share': round(counts['layout_fields'] / counts['fields'], 4) if counts['fields'] else None,
+        'layout_field_recall': (round(counts['layout_fields_found'] / counts['layout_fields'], 4)
+                                if counts['layout_fields'] else None),
+        'counts': counts,
+    }
+
+def detect_to_verify(image, verify=False):
+    """The /detect then /verify flow without the web layer"""
+    detection = detect_card_and_fields(image)
+    if detection is None:
+        return None
+    fields = detection['fields'] or extract_fields(detection['card'])[0]
+    ocr_results = extract_text_batch({name: field['image'] for name, field in fields.items()})
+    license_data = {name: result['text'] for name, result in ocr_results.items()}
+    if verify:
+        from db_utils import verify_license
+        verify_license(license_data.get('dl_number', ''), license_data.get('name', ''),
+                       license_data.get('valid_till', ''))
+    return license_data
+
+def run_benchmark(splits, dataset_dir=DATASET_DIR, limit=None, verify=False):
+    """Benchmark every requested split; returns the JSON-serializable report"""
+    names = load_class_names(dataset_dir)
+    warm_up()
+    ocr_utils.warm_up()
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'model_variant': DEFAULT_VARIANT,
+            'detect_imgsz': DETECT_IMGSZ,
+            'rectify_card': RECTIFY_CARD,
+            'verify': verify,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'splits': {},
+    }
+    for split in splits:
+        if not os.path.isdir(os.path.join(dataset_dir, split, 'images')):
+            logger.warning(f"Split {split} not found in {dataset_dir}, skipping")
+            continue
+        samples = load_split(split, names, dataset_dir)[:limit]
+        timer = StageTimer()
+        start = time.perf_counter()
+        accuracy = run_stages(samples, timer, verify)
+        elapsed = time.perf_counter() - start
+        accuracy.update(evaluate_map(samples, names))
+        report['splits'][split] = {
+            'images': len(samples),
+            'images_per_second': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+            'stages': timer.summary(),
+            'accuracy': accuracy,
+        }
+        logger.info(f"{split}: {len(samples)} images in {elapsed:.1f}s")
+
+    report['peak_rss_bytes'] = peak_rss_bytes()
+    report['models'] = model_stats()
+    return report
+
+def compare(report, baseline):
+    """Print latency and accuracy changes against a previous report"""
+    for split, current in report['splits'].items():
+        previous = baseline.get('splits', {}).get(split)
+        if previous is None:
+            continue
+        print(f"[{split}]")
+        for stage, stats in current['stages'].items():
+            before = previous['stages'].get(stage)
+            if before:
+                change = (stats['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+                print(f"  {stage:<26} p50 {before['p50_ms']:>9.2f} -> {stats['p50_ms']:>9.2f} ms ({change:+.1f}%)")
+        for metric in ('map50', 'card_recall', 'field_recall', 'layout_field_recall'):
+            print(f"  {metric:<26} {previous['accuracy'].get(metric)} -> {current['accuracy'].get(metric)}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the detection and OCR pipeline on the dataset splits')
+    parser.add_argument('--splits', nargs='+', default=DEFAULT_SPLITS)
+    parser.add_argument('--dataset', default=DATASET_DIR)
+    parser.add_argument('--limit', type=int, default=None, help='images per split')
+    parser.add_argument('--verify', action='store_true', help='include the database lookup')
+    parser.add_argument('--output', help='JSON report path (default benchmarks/<timestamp>.json)')
+    parser.add_argument('--compare', help='previous JSON report to compare against')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = run_benchmark(args.splits, args.dataset, args.limit, args.verify)
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d_%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report['splits'], indent=2))
+    print(f"Report saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+import time
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from threading import Lock
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after ttl seconds
+    Keeps hit/miss/eviction/expiration counters for monitoring
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value), oldest first
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """Return the cached value and mark it recently used, or default"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Store value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        """Return a snapshot of the live (key, value) pairs, oldest first"""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (expires_at, value) in self._data.items()
+                    if expires_at >= now]
+
+    def stats(self):
+        """Return cache counters and the current hit rate"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+class NearDuplicateCache:
+    """
+    Small cache keyed on 64-bit perceptual hashes, where a lookup matches any
+    entry within max_distance differing bits that is younger than ttl seconds
+    Entries stored under a scope (e.g. a client id) only match lookups with
+    the same scope
+    """
+
+    def __init__(self, maxsize=64, ttl=2.0, max_distance=4):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._data = OrderedDict()  # (scope, hash) -> (stored_at, value), oldest first
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, image_hash, default=None, scope=None):
+        """Return the value stored for the nearest matching hash in scope, or default"""
+        now = time.monotonic()
+        with self._lock:
+            # Drop expired entries from the old end first
+            while self._data:
+                oldest = next(iter(self._data))
+                if now - self._data[oldest][0] <= self.ttl:
+                    break
+                del self._data[oldest]
+
+            best, best_distance = None, self.max_distance + 1
+            for key in self._data:
+                if key[0] != scope:
+                    continue
+                distance = bin(key[1] ^ image_hash).count('1')
+                if distance < best_distance:
+                    best, best_distance = key, distance
+
+            if best is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return self._data[best][1]
+
+    def set(self, image_hash, value, scope=None):
+        key = (scope, image_hash)
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+def content_hash(array):
+    """Exact content hash of a NumPy image, including its shape"""
+    digest = hashlib.sha1(str(array.shape).encode())
+    digest.update(np.ascontiguousarray(array).data)
+    return digest.hexdigest()
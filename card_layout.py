@@ -0,0 +1,117 @@
+import os
+import glob
+import logging
+import cv2
+import numpy as np
+from image_utils import find_card_quad, detect_license_fields
+from metrics import timed, count
+
+logger = logging.getLogger(__name__)
+
+# Cards are warped to this size (ID-1 format, 85.6 x 54 mm at 10 px/mm)
+CANONICAL_SIZE = (856, 540)
+ASPECT_TOLERANCE = 0.2  # relative deviation from the canonical aspect still accepted
+FIELD_PADDING = 0.02  # fraction of the card added around each layout box
+
+# Field boxes as (x1, y1, x2, y2) fractions of the card, per card template.
+# 'default' is the median of the boxes labelled in datasets/ (see layout_from_labels)
+LAYOUTS = {
+    'default': {
+        'dl_number': (0.222, 0.174, 0.565, 0.278),
+        'valid_till': (0.526, 0.384, 0.681, 0.465),
+        'name': (0.068, 0.630, 0.268, 0.717),
+    },
+}
+LAYOUT_TEMPLATE = os.getenv('LAYOUT_TEMPLATE', 'default')
+# Set USE_CARD_LAYOUT=0 to always run the field detector
+USE_CARD_LAYOUT = os.getenv('USE_CARD_LAYOUT', '1') != '0'
+
+def card_warp(card, size=CANONICAL_SIZE):
+    """
+    Perspective transform from a card crop to the canonical size, or None
+    when no plausible card outline is found
+    """
+    quad = find_card_quad(card)
+    if quad is None:
+        return None
+    width, height = size
+    tl, tr, br, bl = quad
+    quad_w = max(np.linalg.norm(tr - tl), np.linalg.norm(br - bl))
+    quad_h = max(np.linalg.norm(bl - tl), np.linalg.norm(br - tr))
+    aspect = quad_w / quad_h if quad_h else 0
+    if abs(aspect / (width / height) - 1) > ASPECT_TOLERANCE:
+        return None
+    target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]],
+                      dtype=np.float32)
+    return cv2.getPerspectiveTransform(quad, target)
+
+def normalize_card(card, size=CANONICAL_SIZE):
+    """
+    Warp the card quadrilateral found inside a card crop to the canonical size
+    Returns tuple of (canonical card, confident: bool); when no plausible
+    outline is found the crop is only resized and confident is False
+    """
+    warp = card_warp(card, size)
+    if warp is not None:
+        return cv2.warpPerspective(card, warp, size, flags=cv2.INTER_CUBIC), True
+    return cv2.resize(card, size, interpolation=cv2.INTER_CUBIC), False
+
+def layout_fields(card, template=None, padding=FIELD_PADDING):
+    """
+    Crop fields from a canonical card using a template layout
+    Returns dictionary with field images and their coordinates, like detect_license_fields
+    """
+    layout = LAYOUTS[template or LAYOUT_TEMPLATE]
+    height, width = card.shape[:2]
+    fields = {}
+    for field_name, (fx1, fy1, fx2, fy2) in layout.items():
+        x1, y1 = int(max(fx1 - padding, 0) * width), int(max(fy1 - padding, 0) * height)
+        x2, y2 = int(min(fx2 + padding, 1) * width), int(min(fy2 + padding, 1) * height)
+        fields[field_name] = {
+            'image': card[y1:y2, x1:x2],
+            'coordinates': (x1, y1, x2, y2)
+        }
+    return fields
+
+@timed('card_normalization')
+def extract_fields(card):
+    """
+    Normalize a card crop and locate its fields
+    Uses the template layout when the card outline was found, so the second
+    YOLO pass is skipped; otherwise runs detect_license_fields on the
+    normalized card
+    Returns tuple of (fields, method) with method 'layout' or 'detector'
+    """
+    canonical, confident = normalize_card(card)
+    if USE_CARD_LAYOUT and confident:
+        count('fields_located', method='layout')
+        return layout_fields(canonical), 'layout'
+    count('fields_located', method='detector')
+    return detect_license_fields(canonical), 'detector'
+
+def layout_from_labels(label_dirs, names):
+    """
+    Derive a layout from YOLO label files with exactly one card per image
+    names lists the class names in id order, as in data.yaml
+    Returns a dict of field name to median (x1, y1, x2, y2) card fractions
+    """
+    boxes = {}
+    for label_dir in label_dirs:
+        for path in glob.glob(os.path.join(label_dir, '*.txt')):
+            with open(path) as f:
+                rows = [line.split() for line in f if line.strip()]
+            cards = [row for row in rows if names[int(row[0])] == 'license-card']
+            if len(cards) != 1:
+                continue
+            cx, cy, w, h = map(float, cards[0][1:5])
+            left, top = cx - w / 2, cy - h / 2
+            for row in rows:
+                field_name = names[int(row[0])]
+                if field_name == 'license-card':
+                    continue
+                fx, fy, fw, fh = map(float, row[1:5])
+                boxes.setdefault(field_name, []).append((
+                    (fx - fw / 2 - left) / w, (fy - fh / 2 - top) / h,
+                    (fx + fw / 2 - left) / w, (fy + fh / 2 - top) / h))
+    return {field_name: tuple(round(float(v), 3) for v in np.median(values, axis=0))
+            for field_name, values in boxes.items()}
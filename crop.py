@@ -1,9 +1,10 @@
-from ultralytics import YOLO 
 import cv2
 import time
+from model_registry import get_yolo
+from frame_selection import CaptureWindow
 
 # Load YOLOv8 model
-model = YOLO('best.pt')  # Your trained model
+model = get_yolo('best.pt')  # Your trained model
 
 # Setup webcam
 cap = cv2.VideoCapture(0)
@@ -19,6 +20,8 @@ required_classes = {
 detected = set()
 license_card_detected = False
 cropped_license_card = None  # To store cropped license card
+capture_window = CaptureWindow(size=10)  # Score crops over several frames
+best_candidate = None
 
 start_time = time.time()
 duration = 20  # seconds
@@ -30,6 +33,7 @@ while True:
 
     # Run detection
     results = model(frame)[0]
+    clean_frame = frame.copy()  # crops must not include the overlays drawn below
 
     # Loop through detections
     for box in results.boxes:
@@ -48,10 +52,14 @@ while True:
         if label in required_classes:
             if confidence >= required_classes[label]:
                 detected.add(label)
-                if label == 'license-card' and not license_card_detected:
+                if label == 'license-card':
                     license_card_detected = True
-                    # Crop and save the license card
-                    cropped_license_card = frame[y1:y2, x1:x2].copy()
+                    # Keep the sharpest, least glary crop rather than the first one
+                    candidate = capture_window.add(
+                        {'card': clean_frame[y1:y2, x1:x2].copy(), 'confidence': confidence}, frame.shape)
+                    if candidate is not None and (best_candidate is None
+                                                  or candidate['score'] > best_candidate['score']):
+                        best_candidate = candidate
 
     # Show frame
     cv2.imshow('Live Detection', frame)
@@ -68,6 +76,12 @@ while True:
 cv2.destroyAllWindows()
 cap.release()
 
+# Include crops from the last, partly filled window
+for candidate in (best_candidate, capture_window.best()):
+    if candidate is not None and (cropped_license_card is None
+                                  or candidate['score'] > best_score):
+        cropped_license_card, best_score = candidate['card'], candidate['score']
+
 if 'license-card' in detected:
     if all(field in detected for field in required_classes):
         print("✅ Access Granted")
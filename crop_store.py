@@ -0,0 +1,204 @@
+import os
+import time
+import queue
+import shutil
+import logging
+from threading import Thread, Lock
+import cv2
+from cache_utils import TTLCache, content_hash
+from metrics import timed, count
+
+logger = logging.getLogger(__name__)
+
+# Where crops go and how much of them is kept
+CROP_DIR = os.getenv('CROP_DIR', 'static/crops')
+CROP_MEMORY_SIZE = int(os.getenv('CROP_MEMORY_SIZE', 64))  # recent crops kept decoded in memory
+CROP_MAX_FILES = int(os.getenv('CROP_MAX_FILES', 5000))
+CROP_MAX_BYTES = int(os.getenv('CROP_MAX_MB', 500)) * 1024 * 1024
+CROP_MAX_AGE = float(os.getenv('CROP_MAX_AGE_HOURS', 7 * 24)) * 3600  # seconds
+RETENTION_INTERVAL = 60  # seconds between retention sweeps
+JPEG_QUALITY = 95
+
+def is_crop_key(key):
+    """Check that key looks like a crop key (a SHA-1 hex digest)"""
+    return isinstance(key, str) and len(key) == 40 and all(c in '0123456789abcdef' for c in key)
+
+def _is_crop_name(name):
+    stem, ext = os.path.splitext(name)
+    return ext == '.jpg' and is_crop_key(stem)
+
+class CropStore:
+    """
+    Content-addressed store of card crops
+    put() keeps the crop in memory and queues it for a background writer,
+    so requests never wait on disk. Files are named by the crop's content
+    hash, so the same crop is only stored once. Old files are swept to stay
+    within max_files / max_bytes / max_age.
+    """
+
+    def __init__(self, directory=CROP_DIR, memory_size=CROP_MEMORY_SIZE, max_files=CROP_MAX_FILES,
+                 max_bytes=CROP_MAX_BYTES, max_age=CROP_MAX_AGE):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._recent = TTLCache(maxsize=memory_size, ttl=max_age)
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._lock = Lock()
+        self._thread = None
+        self._last_sweep = 0
+        self.writes = 0
+        self.duplicates = 0
+        self.deleted = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._write_loop, name='crop-writer', daemon=True)
+                self._thread.start()
+        return self
+
+    def filename(self, key):
+        return f"{key}.jpg"
+
+    def path(self, key):
+        return os.path.join(self.directory, self.filename(key))
+
+    def put(self, image):
+        """Store a crop and return its key (the content hash)"""
+        key = content_hash(image)
+        # Crops are usually views into a whole frame; don't keep the frame alive
+        image = image.copy() if image.base is not None else image
+        self._recent.set(key, image)
+        with self._lock:
+            if key in self._queued:
+                return key
+            self._queued.add(key)
+        self.start()
+        self._queue.put((key, image))
+        return key
+
+    def get(self, key):
+        """Return the crop for key from memory or disk, or None if it is gone"""
+        if not is_crop_key(key):
+            return None
+        image = self._recent.get(key)
+        if image is not None:
+            return image
+        image = cv2.imread(self.path(key))
+        if image is not None:
+            self._recent.set(key, image)
+        return image
+
+    def encoded(self, key):
+        """JPEG bytes of a crop, e.g. to serve it before the writer reached it"""
+        if not is_crop_key(key):
+            return None
+        image = self._recent.get(key)
+        if image is None:
+            path = self.path(key)
+            if not os.path.exists(path):
+                return None
+            with open(path, 'rb') as f:
+                return f.read()
+        ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        return buffer.tobytes() if ok else None
+
+    def keep(self, key, directory):
+        """
+        Copy a crop out of the store to a directory that retention never
+        touches (e.g. for images referenced from the database)
+        Returns the new path, or None if the crop is gone
+        """
+        if not is_crop_key(key):
+            return None
+        os.makedirs(directory, exist_ok=True)
+        target = os.path.join(directory, self.filename(key))
+        if os.path.exists(target):
+            return target
+        if os.path.exists(self.path(key)):
+            shutil.copyfile(self.path(key), target)
+            return target
+        image = self.get(key)
+        if image is None:
+            return None
+        cv2.imwrite(target, image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        return target
+
+    def flush(self):
+        """Block until every queued crop is on disk"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _write_loop(self):
+        while True:
+            try:
+                key, image = self._queue.get(timeout=RETENTION_INTERVAL)
+            except queue.Empty:
+                self._maybe_sweep()
+                continue
+            try:
+                self._write(key, image)
+            except Exception as e:
+                logger.error(f"Could not write crop {key}: {e}")
+            finally:
+                with self._lock:
+                    self._queued.discard(key)
+                self._queue.task_done()
+            self._maybe_sweep()
+
+    @timed('crop_write')
+    def _write(self, key, image):
+        path = self.path(key)
+        if os.path.exists(path):
+            os.utime(path)  # seen again, so it counts as recent for retention
+            self.duplicates += 1
+            count('crop_duplicate')
+            return
+        # Write under a temporary name so readers never see a partial file
+        tmp_path = os.path.join(self.directory, f"{key}.tmp.jpg")  # imwrite picks the codec by extension
+        if not cv2.imwrite(tmp_path, image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY]):
+            raise IOError(f"cv2.imwrite failed for {tmp_path}")
+        os.replace(tmp_path, path)
+        self.writes += 1
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if now - self._last_sweep >= RETENTION_INTERVAL:
+            self._last_sweep = now
+            self.sweep()
+
+    def sweep(self):
+        """Delete crops older than max_age, then the oldest until within max_files and max_bytes"""
+        files = []
+        for entry in os.scandir(self.directory):
+            # Only files named by the store; anything else in the folder is left alone
+            if entry.is_file() and _is_crop_name(entry.name):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        cutoff = time.time() - self.max_age
+        remaining = len(files)
+        for mtime, size, path in files:
+            if mtime >= cutoff and remaining <= self.max_files and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.deleted += 1
+            except OSError as e:
+                logger.warning(f"Could not delete old crop {path}: {e}")
+            remaining -= 1
+            total -= size
+
+    def stats(self):
+        return {
+            'writes': self.writes,
+            'duplicates': self.duplicates,
+            'deleted': self.deleted,
+            'queued': self._queue.qsize(),
+            'memory': self._recent.stats(),
+        }
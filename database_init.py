@@ -1,21 +1,62 @@
-from db_utils import create_connection
+from db_utils import get_db_connection, normalize_name
+
+def column_exists(cursor, table, column):
+    cursor.execute("""
+    SELECT COUNT(*) FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+def index_exists(cursor, table, index):
+    cursor.execute("""
+    SELECT COUNT(*) FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index))
+    return cursor.fetchone()[0] > 0
+
+def migrate_licenses(cursor):
+    """Bring a table created by an older init_db up to the current schema"""
+    if not column_exists(cursor, 'licenses', 'name_normalized'):
+        cursor.execute("ALTER TABLE licenses ADD COLUMN name_normalized VARCHAR(255) AFTER name")
+
+    # Lookups go by normalized DL number; IGNORE skips rows that would collide
+    cursor.execute("""
+    UPDATE IGNORE licenses
+    SET dl_number = UPPER(REPLACE(REPLACE(dl_number, ' ', ''), '-', ''))
+    """)
+
+    cursor.execute("SELECT id, name FROM licenses WHERE name_normalized IS NULL")
+    rows = cursor.fetchall()
+    cursor.executemany("UPDATE licenses SET name_normalized = %s WHERE id = %s",
+                       [(normalize_name(name), row_id) for row_id, name in rows])
+
+    if not index_exists(cursor, 'licenses', 'idx_name_normalized'):
+        cursor.execute("CREATE INDEX idx_name_normalized ON licenses (name_normalized)")
+    if not index_exists(cursor, 'licenses', 'idx_valid_till'):
+        cursor.execute("CREATE INDEX idx_valid_till ON licenses (valid_till)")
 
 def init_db():
-    conn = create_connection()
+    conn = get_db_connection()
     cursor = conn.cursor()
-    
+
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS licenses (
         id INT AUTO_INCREMENT PRIMARY KEY,
         dl_number VARCHAR(255) UNIQUE,
         name VARCHAR(255),
+        name_normalized VARCHAR(255),
         valid_till DATE,
         image_path VARCHAR(255),
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_name_normalized (name_normalized),
+        INDEX idx_valid_till (valid_till)
     )
     """)
-    
+    migrate_licenses(cursor)
+    conn.commit()
+
     print("Database initialized successfully!")
+    cursor.close()
     conn.close()
 
 if __name__ == '__main__':
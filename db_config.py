@@ -1,6 +1,23 @@
+import os
+
 DB_CONFIG = {
     'host': 'localhost',
     'user': 'root',
     'password': '',
-    'database': 'license_db'
-}
\ No newline at end of file
+    'database': 'license_db',
+    # Every statement is its own transaction, so a pooled connection never
+    # keeps a REPEATABLE READ snapshot open across lookups
+    'autocommit': True
+}
+
+# Connection pool settings
+DB_POOL_CONFIG = {
+    'pool_name': 'license_pool',
+    'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+    'pool_reset_session': False  # autocommit leaves no open transaction to reset, skip the round-trip
+}
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5))  # seconds to wait for a free connection
+
+# In-process cache of licence records, keyed by normalized DL number
+LICENSE_CACHE_SIZE = int(os.getenv('LICENSE_CACHE_SIZE', 10000))
+LICENSE_CACHE_TTL = float(os.getenv('LICENSE_CACHE_TTL', 300))  # seconds
\ No newline at end of file
@@ -1,20 +1,147 @@
-import mysql.connector
-from db_config import DB_CONFIG
+from mysql.connector import pooling
+from db_config import (DB_CONFIG, DB_POOL_CONFIG, DB_POOL_TIMEOUT,
+                       LICENSE_CACHE_SIZE, LICENSE_CACHE_TTL)
+from cache_utils import TTLCache
+from metrics import timed
 from datetime import datetime
+from difflib import SequenceMatcher
+from threading import Lock
 import logging
+import time
+import re
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Queries run through server-side prepared statements
+FETCH_QUERY = """
+SELECT dl_number, name, name_normalized, valid_till, image_path, created_at
+FROM licenses WHERE dl_number = %s
+"""
+UPSERT_QUERY = """
+INSERT INTO licenses (dl_number, name, name_normalized, valid_till, image_path, created_at)
+VALUES (%s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE id = id
+"""
+
+# Minimum similarity for an OCR'd name to match the stored one
+NAME_MATCH_THRESHOLD = 0.8
+# Share of the stored name a partial read (whole tokens only) must cover
+NAME_MIN_PARTIAL = 0.5
+# Digits an OCR'd expiry date may differ by and still match
+DATE_MAX_DIGIT_ERRORS = 1
+
+_pool = None
+_pool_lock = Lock()
+
+# Licence rows recently read from the database; add_license invalidates entries
+license_cache = TTLCache(maxsize=LICENSE_CACHE_SIZE, ttl=LICENSE_CACHE_TTL)
+
+def get_pool():
+    """Create the connection pool on first use and return it"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pooling.MySQLConnectionPool(**DB_POOL_CONFIG, **DB_CONFIG)
+    return _pool
+
 def get_db_connection():
-    """Create and return a new database connection"""
+    """
+    Borrow a connection from the pool, waiting up to DB_POOL_TIMEOUT seconds
+    for one to come free. Calling close() on it returns it to the pool.
+    """
+    deadline = time.monotonic() + DB_POOL_TIMEOUT
+    while True:
+        try:
+            conn = get_pool().get_connection()
+            break
+        except pooling.PoolError:
+            if time.monotonic() >= deadline:
+                logger.error("Database connection error: pool exhausted")
+                raise
+            time.sleep(0.05)
+        except Exception as e:
+            logger.error(f"Database connection error: {e}")
+            raise
+
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
+        # Health check, transparently reconnects a connection the server dropped
+        conn.ping(reconnect=True, attempts=2, delay=0)
     except Exception as e:
+        conn.close()
         logger.error(f"Database connection error: {e}")
         raise
+    return conn
+
+def _fetchone_dict(cursor):
+    """Fetch one row from a prepared cursor as a dict keyed by column name"""
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip(cursor.column_names, row))
+
+def normalize_name(name):
+    """Uppercase a name and collapse runs of whitespace"""
+    return ' '.join((name or '').upper().split())
+
+def normalize_dl_number(dl_number):
+    """Uppercase a licence number and drop spaces and dashes"""
+    return re.sub(r'[\s\-]', '', (dl_number or '').upper())
+
+def names_match(ocr_name, stored_name):
+    """Fuzzy name comparison tolerant of OCR errors and partial reads"""
+    ocr_name = normalize_name(ocr_name)
+    stored_name = normalize_name(stored_name)
+    if not ocr_name or not stored_name:
+        return False
+    # A partial read must be whole tokens of the stored name and cover enough
+    # of it, so a stray letter or a bare surname doesn't match everyone
+    stored_tokens = stored_name.split()
+    if (all(token in stored_tokens for token in ocr_name.split())
+            and len(ocr_name) >= NAME_MIN_PARTIAL * len(stored_name)):
+        return True
+    return SequenceMatcher(None, ocr_name, stored_name).ratio() >= NAME_MATCH_THRESHOLD
+
+def dates_match(ocr_date, stored_date):
+    """
+    Compare expiry dates digit by digit, allowing DATE_MAX_DIGIT_ERRORS
+    misreads in the month and day; the year must match exactly
+    """
+    ocr_digits = re.sub(r'\D', '', str(ocr_date or ''))
+    stored_digits = re.sub(r'\D', '', str(stored_date or ''))
+    if len(ocr_digits) != 8 or len(stored_digits) != 8:
+        return False
+    if ocr_digits[:4] != stored_digits[:4]:
+        return False
+    errors = sum(a != b for a, b in zip(ocr_digits, stored_digits))
+    return errors <= DATE_MAX_DIGIT_ERRORS
+
+def fetch_license(dl_number):
+    """
+    Look up a license by its (indexed) normalized DL number, using the
+    in-process cache first
+    Returns the row as a dict, or None if there is no such license
+    """
+    key = normalize_dl_number(dl_number)
+    result = license_cache.get(key)
+    if result is not None:
+        return result
+
+    with timed('db_query'):
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor(prepared=True)
+            cursor.execute(FETCH_QUERY, (key,))
+            result = _fetchone_dict(cursor)
+            cursor.close()
+        finally:
+            conn.close()
+
+    # Only existing licences are cached so a newly added one is never missed
+    if result is not None:
+        license_cache.set(key, result)
+    return result
 
 def verify_license(dl_number, name, valid_till):
     """
@@ -22,20 +149,11 @@ def verify_license(dl_number, name, valid_till):
     Returns tuple of (exists: bool, details: dict)
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        query = """
-        SELECT * FROM licenses 
-        WHERE dl_number = %s AND name LIKE %s AND valid_till = %s
-        """
-        cursor.execute(query, (dl_number, f"%{name}%", valid_till))
-        result = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
-        
-        if result:
+        result = fetch_license(dl_number)
+
+        if (result
+                and names_match(name, result['name_normalized'] or result['name'])
+                and dates_match(valid_till, result['valid_till'])):
             return True, {
                 'dl_number': result['dl_number'],
                 'name': result['name'],
@@ -44,7 +162,7 @@ def verify_license(dl_number, name, valid_till):
                 'created_at': result['created_at']
             }
         return False, None
-        
+
     except Exception as e:
         logger.error(f"License verification error: {e}")
         return False, None
@@ -55,33 +173,32 @@ def add_license(dl_number, name, valid_till, image_path):
     Returns tuple of (success: bool, message: str)
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if license already exists
-        check_query = "SELECT id FROM licenses WHERE dl_number = %s"
-        cursor.execute(check_query, (dl_number,))
-        if cursor.fetchone():
-            cursor.close()
-            conn.close()
+        with timed('db_upsert'):
+            conn = get_db_connection()
+            try:
+                license_cache.invalidate(normalize_dl_number(dl_number))
+                cursor = conn.cursor(prepared=True)
+                # Single round-trip: an existing DL number leaves the row untouched
+                cursor.execute(UPSERT_QUERY, (normalize_dl_number(dl_number), name, normalize_name(name),
+                                              valid_till, image_path, datetime.now()))
+                inserted = cursor.rowcount == 1
+                conn.commit()
+                cursor.close()
+            finally:
+                conn.close()
+
+        if not inserted:
             return False, "License already exists in database"
-        
-        # Insert new license
-        query = """
-        INSERT INTO licenses (dl_number, name, valid_till, image_path, created_at)
-        VALUES (%s, %s, %s, %s, %s)
-        """
-        cursor.execute(query, (dl_number, name, valid_till, image_path, datetime.now()))
-        conn.commit()
-        
-        cursor.close()
-        conn.close()
         return True, "License added successfully"
-        
+
     except Exception as e:
         logger.error(f"License addition error: {e}")
         return False, str(e)
 
+def license_cache_stats():
+    """Return hit/miss/eviction counters of the licence cache"""
+    return license_cache.stats()
+
 def check_admin_password(password):
     """
     Simple password check (in production, use proper hashing)
@@ -0,0 +1,77 @@
+import numpy as np
+from collections import deque
+from threading import Lock
+from tracking import sharpness
+
+# How much each quality measure contributes to a candidate's score
+SCORE_WEIGHTS = {
+    'confidence': 0.3,
+    'sharpness': 0.35,
+    'glare': 0.2,
+    'size': 0.15,
+}
+SHARPNESS_NORM = 500.0  # Laplacian variance treated as "fully sharp"
+SIZE_NORM = 0.25  # card area / frame area treated as "close enough"
+
+def glare_fraction(image, threshold=245):
+    """Fraction of pixels blown out to near-white (glare or overexposure)"""
+    if image is None or image.size == 0:
+        return 1.0
+    brightest = image.max(axis=2) if image.ndim == 3 else image
+    return float(np.count_nonzero(brightest >= threshold)) / brightest.size
+
+def score_crop(crop, confidence, frame_shape):
+    """
+    Score a card crop for OCR suitability
+    Returns tuple of (score: float, measures: dict)
+    """
+    frame_area = frame_shape[0] * frame_shape[1]
+    measures = {
+        'confidence': float(confidence),
+        'sharpness': sharpness(crop),
+        'glare': glare_fraction(crop),
+        'size': crop.shape[0] * crop.shape[1] / frame_area if frame_area else 0.0,
+    }
+    score = (
+        SCORE_WEIGHTS['confidence'] * measures['confidence']
+        + SCORE_WEIGHTS['sharpness'] * min(measures['sharpness'] / SHARPNESS_NORM, 1.0)
+        + SCORE_WEIGHTS['glare'] * (1.0 - min(measures['glare'] * 10, 1.0))
+        + SCORE_WEIGHTS['size'] * min(measures['size'] / SIZE_NORM, 1.0)
+    )
+    return score, measures
+
+class CaptureWindow:
+    """
+    Fixed-size ring buffer of candidate card detections
+    add() returns the best-scoring candidate once size candidates have been
+    collected, then starts a new window; until then it returns None
+    """
+
+    def __init__(self, size=5):
+        self.size = size
+        self._candidates = deque(maxlen=size)
+        self._lock = Lock()
+
+    def add(self, detection, frame_shape):
+        """Score a detection dict (needs 'card' and 'confidence') and buffer it"""
+        score, measures = score_crop(detection['card'], detection['confidence'], frame_shape)
+        detection['score'] = score
+        detection['quality'] = measures
+        with self._lock:
+            self._candidates.append(detection)
+            if len(self._candidates) < self.size:
+                return None
+            best = max(self._candidates, key=lambda d: d['score'])
+            self._candidates.clear()
+            return best
+
+    def best(self):
+        """Best candidate collected so far in the current window, or None"""
+        with self._lock:
+            if not self._candidates:
+                return None
+            return max(self._candidates, key=lambda d: d['score'])
+
+    def clear(self):
+        with self._lock:
+            self._candidates.clear()
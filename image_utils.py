@@ -1,46 +1,150 @@
+import os
 import cv2
 import numpy as np
-from ultralytics import YOLO
-from PIL import Image
-import io
+from threading import Lock
+from model_registry import get_yolo
+from cache_utils import NearDuplicateCache
+from batching import BatchScheduler
+from metrics import timed
 
-# Load models
-license_model = YOLO('best.pt')
-fields_model = YOLO('best.pt')
+# Class ids used by the detector and the confidence each one must reach
+CARD_CLASS = 0
+FIELD_CLASSES = {1: 'name', 2: 'dl_number', 3: 'valid_till'}
+CARD_CONFIDENCE = 0.93
+FIELD_CONFIDENCE = 0.85
 
+# Longest side (pixels) frames are shrunk to before detection; 0 detects at
+# full resolution. Crops are always taken from the full-resolution frame.
+DETECT_IMGSZ = int(os.getenv('DETECT_IMGSZ', 0))
+# Set RECTIFY_CARD=1 to warp the card quadrilateral to an upright rectangle
+RECTIFY_CARD = os.getenv('RECTIFY_CARD', '0') == '1'
+RECTIFY_MARGIN = 0.05  # fraction of the box added on each side when looking for the card edges
+RECTIFY_MIN_AREA = 0.5  # the quadrilateral must cover this much of the search region
+
+# Boxes of recent detections per client, reused for its near-identical frames
+card_cache = NearDuplicateCache(maxsize=64, ttl=2.0, max_distance=4)
+card_and_fields_cache = NearDuplicateCache(maxsize=64, ttl=2.0, max_distance=4)
+
+# The shared YOLO model is not safe to call from several threads at once and
+# is used by request, pipeline, batching and verification threads alike
+_predict_lock = Lock()
+
+# Names the trained weights may use for each class (see datasets/data.yaml)
+CLASS_ALIASES = {
+    'license-card': 'license_card',
+    'license_card': 'license_card',
+    'name': 'name',
+    'dl_number': 'dl_number',
+    'valid_till': 'valid_till',
+}
+
+def resolve_class_ids(model):
+    """
+    Map class ids to card/field names using the names stored in the weights
+    Falls back to CARD_CLASS / FIELD_CLASSES when the names are unknown
+    """
+    names = getattr(model, 'names', None) or {}
+    resolved = {}
+    for cls_id, label in dict(names).items():
+        alias = CLASS_ALIASES.get(str(label).lower())
+        if alias:
+            resolved[int(cls_id)] = alias
+
+    if 'license_card' in resolved.values() and len(resolved) == len(FIELD_CLASSES) + 1:
+        card_class = next(k for k, v in resolved.items() if v == 'license_card')
+        field_classes = {k: v for k, v in resolved.items() if k != card_class}
+        return card_class, field_classes
+    return CARD_CLASS, dict(FIELD_CLASSES)
+
+def thumbnail(image, max_side=DETECT_IMGSZ):
+    """
+    Shrink image so its longer side is at most max_side (0 leaves it as is)
+    Returns tuple of (image, scale) where scale maps original to thumbnail pixels
+    """
+    height, width = image.shape[:2]
+    if not max_side or max(height, width) <= max_side:
+        return image, 1.0
+    scale = max_side / max(height, width)
+    size = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA), scale
+
+def _predict_kwargs():
+    """Extra predict() arguments for the configured detection size"""
+    if not DETECT_IMGSZ:
+        return {}
+    return {'imgsz': max(DETECT_IMGSZ // 32 * 32, 32)}  # YOLO needs a multiple of its stride
+
+def _predict(model, source, **kwargs):
+    """Run model.predict, serialized across threads"""
+    with _predict_lock:
+        return model.predict(source, **kwargs)
+
+def _full_resolution_box(xyxy, scale, shape):
+    """Map a box predicted on a thumbnail back to the original image, clipped to it"""
+    height, width = shape[:2]
+    x1, y1, x2, y2 = (float(v) / scale for v in xyxy)
+    return (min(max(int(x1), 0), width), min(max(int(y1), 0), height),
+            min(max(int(x2), 0), width), min(max(int(y2), 0), height))
+
+def predict_boxes(image, conf, classes=None):
+    """
+    Run the detector the way the app does (same resize and imgsz), e.g. for evaluation
+    Returns list of (class id, confidence, box) with boxes in image coordinates
+    """
+    small, scale = thumbnail(image)
+    kwargs = _predict_kwargs()
+    if classes is not None:
+        kwargs['classes'] = classes
+    result = _predict(get_yolo(), small, conf=conf, verbose=False, **kwargs)[0]
+    return [(int(box.cls.item()), box.conf.item(), _full_resolution_box(box.xyxy[0], scale, image.shape))
+            for box in result.boxes]
+
+@timed('detect_card')
 def detect_license_card(image):
     """
     Detect license card in image using YOLOv8
     Returns cropped image, confidence, and bounding box coordinates
     """
-    results = license_model.predict(image, conf=0.93, classes=[0])
-    if len(results[0].boxes) > 0:
-        box = results[0].boxes[0]
+    model = get_yolo()
+    card_class, _ = resolve_class_ids(model)
+    small, scale = thumbnail(image)
+    results = _predict(model, small, conf=CARD_CONFIDENCE, classes=[card_class], **_predict_kwargs())
+    return _parse_card_result(results[0], image, scale)
+
+def _parse_card_result(result, image, scale=1.0):
+    """Turn one YOLO result into (cropped image, confidence, box) in full resolution"""
+    if len(result.boxes) > 0:
+        box = result.boxes[0]
         confidence = box.conf.item()
-        x1, y1, x2, y2 = map(int, box.xyxy[0])
-        cropped = image[y1:y2, x1:x2]
-        return cropped, confidence, (x1, y1, x2, y2)
+        box = _full_resolution_box(box.xyxy[0], scale, image.shape)
+        return _crop_card(image, box), confidence, box
     return None, 0, (0, 0, 0, 0)
 
+def _crop_card(image, box):
+    """Crop (or with RECTIFY_CARD, rectify) the card in box from image"""
+    if RECTIFY_CARD:
+        cropped, _ = rectify_card(image, box)
+        return cropped
+    x1, y1, x2, y2 = box
+    return image[y1:y2, x1:x2]
+
+@timed('field_detection')
 def detect_license_fields(image):
     """
     Detect fields (name, dl_number, valid_till) in cropped license image
     Returns dictionary with field images and their coordinates
     """
-    results = fields_model.predict(image, conf=0.85, classes=[1, 2, 3])
+    model = get_yolo()
+    _, field_classes = resolve_class_ids(model)
+    results = _predict(model, image, conf=FIELD_CONFIDENCE, classes=list(field_classes))
     
     fields = {}
     for box in results[0].boxes:
         cls = int(box.cls.item())
         x1, y1, x2, y2 = map(int, box.xyxy[0])
         
-        if cls == 1:
-            field_name = 'name'
-        elif cls == 2:
-            field_name = 'dl_number'
-        elif cls == 3:
-            field_name = 'valid_till'
-        else:
+        field_name = field_classes.get(cls)
+        if field_name is None:
             continue
             
         fields[field_name] = {
@@ -50,15 +154,298 @@ def detect_license_fields(image):
     
     return fields
 
-def bytes_to_cv2image(image_bytes):
-    """Convert image bytes to OpenCV format"""
-    image = Image.open(io.BytesIO(image_bytes))
-    return cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+@timed('detect_card_and_fields')
+def detect_card_and_fields(image, rectify=None):
+    """
+    Detect the license card and its fields with a single YOLO pass
+    Returns None when no card is found, otherwise a dict with the cropped card,
+    its confidence and box, and the fields inside it in card coordinates
+    rectify defaults to RECTIFY_CARD
+    """
+    model = get_yolo()
+    card_class, field_classes = resolve_class_ids(model)
+    small, scale = thumbnail(image)
+    results = _predict(model, small, conf=min(CARD_CONFIDENCE, FIELD_CONFIDENCE),
+                       classes=[card_class] + list(field_classes), **_predict_kwargs())
+    return _parse_card_and_fields(results[0], image, scale, card_class, field_classes, rectify)
+
+def _parse_card_and_fields(result, image, scale, card_class, field_classes, rectify=None):
+    """Turn one YOLO result into a detect_card_and_fields dict in full resolution"""
+    cards = []
+    candidates = []
+    for box in result.boxes:
+        cls = int(box.cls.item())
+        confidence = box.conf.item()
+        coords = _full_resolution_box(box.xyxy[0], scale, image.shape)
+        if cls == card_class and confidence >= CARD_CONFIDENCE:
+            cards.append((confidence, coords))
+        elif cls in field_classes and confidence >= FIELD_CONFIDENCE:
+            candidates.append((field_classes[cls], confidence, coords))
+
+    if not cards:
+        return None
+
+    confidence, (x1, y1, x2, y2) = max(cards)
+    cropped = image[y1:y2, x1:x2]
+    height, width = cropped.shape[:2]
+
+    # Keep the most confident box per field whose centre lies inside the card
+    fields = {}
+    for field_name, field_conf, (fx1, fy1, fx2, fy2) in sorted(candidates, key=lambda c: c[1]):
+        cx, cy = (fx1 + fx2) / 2, (fy1 + fy2) / 2
+        if not (x1 <= cx <= x2 and y1 <= cy <= y2):
+            continue
+        rx1, ry1 = max(fx1 - x1, 0), max(fy1 - y1, 0)
+        rx2, ry2 = min(fx2 - x1, width), min(fy2 - y1, height)
+        fields[field_name] = {
+            'image': cropped[ry1:ry2, rx1:rx2],
+            'coordinates': (rx1, ry1, rx2, ry2),
+            'confidence': field_conf
+        }
+
+    detection = {
+        'card': cropped,
+        'confidence': confidence,
+        'box': (x1, y1, x2, y2),
+        'fields': fields
+    }
+    if RECTIFY_CARD if rectify is None else rectify:
+        detection = rectify_detection(image, detection)
+    return detection
+
+@timed('detect_card_and_fields_batch')
+def detect_card_and_fields_batch(images):
+    """
+    Run detect_card_and_fields on several images with one predict call
+    Returns a list of detection dicts (or None), one per image
+    """
+    model = get_yolo()
+    card_class, field_classes = resolve_class_ids(model)
+    thumbnails = [thumbnail(image) for image in images]
+    results = _predict(model, [small for small, scale in thumbnails],
+                       conf=min(CARD_CONFIDENCE, FIELD_CONFIDENCE),
+                       classes=[card_class] + list(field_classes), verbose=False, **_predict_kwargs())
+    return [_parse_card_and_fields(result, image, scale, card_class, field_classes)
+            for result, image, (small, scale) in zip(results, images, thumbnails)]
+
+# Gathers concurrent single-frame requests into batched predict calls
+card_batcher = BatchScheduler(detect_card_and_fields_batch)
+
+@timed('detect_card_and_fields_batched')
+def detect_card_and_fields_batched(image):
+    """detect_card_and_fields, batched with other requests arriving at the same time"""
+    return card_batcher(image)
+
+def _order_corners(points):
+    """Order four points as top-left, top-right, bottom-right, bottom-left"""
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1).ravel()
+    return np.array([points[np.argmin(sums)], points[np.argmin(diffs)],
+                     points[np.argmax(sums)], points[np.argmax(diffs)]], dtype=np.float32)
+
+def find_card_quad(image, min_area=RECTIFY_MIN_AREA):
+    """
+    Find the card outline as four corners (ordered tl, tr, br, bl) in image
+    Returns None when no large enough convex quadrilateral is found
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    min_area *= image.shape[0] * image.shape[1]
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+        if cv2.contourArea(contour) < min_area:
+            break
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        if len(approx) == 4 and cv2.isContourConvex(approx):
+            return _order_corners(approx.reshape(4, 2).astype(np.float32))
+    return None
+
+def rectify_card(image, box, margin=RECTIFY_MARGIN):
+    """
+    Crop the card in box from the full-resolution image, warping its
+    quadrilateral to an upright rectangle when the outline can be found
+    Returns tuple of (card image, transform) where transform maps card-box
+    coordinates into the rectified card, or None if the plain crop was used
+    """
+    x1, y1, x2, y2 = box
+    height, width = image.shape[:2]
+    pad_x, pad_y = int((x2 - x1) * margin), int((y2 - y1) * margin)
+    rx1, ry1 = max(x1 - pad_x, 0), max(y1 - pad_y, 0)
+    rx2, ry2 = min(x2 + pad_x, width), min(y2 + pad_y, height)
+    region = image[ry1:ry2, rx1:rx2]
+
+    quad = find_card_quad(region) if region.size else None
+    if quad is None:
+        return image[y1:y2, x1:x2], None
+
+    tl, tr, br, bl = quad
+    out_w = int(max(np.linalg.norm(tr - tl), np.linalg.norm(br - bl)))
+    out_h = int(max(np.linalg.norm(bl - tl), np.linalg.norm(br - tr)))
+    target = np.array([[0, 0], [out_w - 1, 0], [out_w - 1, out_h - 1], [0, out_h - 1]], dtype=np.float32)
+    warp = cv2.getPerspectiveTransform(quad, target)
+    card = cv2.warpPerspective(region, warp, (out_w, out_h), flags=cv2.INTER_CUBIC)
+
+    # Card-box coordinates are offset from the search region by the margin
+    shift = np.array([[1, 0, x1 - rx1], [0, 1, y1 - ry1], [0, 0, 1]], dtype=np.float64)
+    return card, warp @ shift
+
+def _transform_box(box, transform, shape):
+    """Bounding box of a box's corners after a perspective transform, clipped to shape"""
+    x1, y1, x2, y2 = box
+    corners = np.array([[[x1, y1], [x2, y1], [x2, y2], [x1, y2]]], dtype=np.float64)
+    warped = cv2.perspectiveTransform(corners, transform)[0]
+    height, width = shape[:2]
+    (wx1, wy1), (wx2, wy2) = warped.min(axis=0), warped.max(axis=0)
+    return (min(max(int(wx1), 0), width), min(max(int(wy1), 0), height),
+            min(max(int(np.ceil(wx2)), 0), width), min(max(int(np.ceil(wy2)), 0), height))
+
+def rectify_detection(image, detection):
+    """Replace a detection's card crop with the rectified card and move its fields along"""
+    card, transform = rectify_card(image, detection['box'])
+    if transform is None:
+        return detection
+
+    fields = {}
+    for field_name, field in detection['fields'].items():
+        fx1, fy1, fx2, fy2 = _transform_box(field['coordinates'], transform, card.shape)
+        fields[field_name] = dict(field, image=card[fy1:fy2, fx1:fx2], coordinates=(fx1, fy1, fx2, fy2))
+    return dict(detection, card=card, fields=fields, rectified=True)
+
+def crop_fields(card_image, coordinates):
+    """
+    Crop previously detected fields from a card image
+    coordinates maps field name to (x1, y1, x2, y2) in card coordinates
+    """
+    fields = {}
+    for field_name, (x1, y1, x2, y2) in coordinates.items():
+        fields[field_name] = {
+            'image': card_image[y1:y2, x1:x2],
+            'coordinates': (x1, y1, x2, y2)
+        }
+    return fields
+
+def dhash(image, hash_size=8):
+    """
+    Difference hash of an image as a hash_size * hash_size bit integer
+    Near-identical frames differ in only a few bits
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def detect_license_card_cached(image, detector=detect_license_card, client=None):
+    """
+    detect_license_card (or detector), reusing the box found in a near-duplicate
+    recent frame of the same client
+    Only boxes are cached; the card is always cropped from image itself
+    """
+    key = dhash(image)
+    cached = card_cache.get(key, scope=client)
+    if cached is not None:
+        confidence, box = cached
+        if confidence == 0:
+            return None, 0, (0, 0, 0, 0)
+        return _crop_card(image, box), confidence, box
+    cropped, confidence, box = detector(image)
+    card_cache.set(key, (confidence if cropped is not None else 0, box), scope=client)
+    return cropped, confidence, box
+
+def _detection_boxes(detection):
+    """A detection without its pixels, for caching"""
+    return dict(detection, card=None, fields={
+        name: {k: v for k, v in field.items() if k != 'image'}
+        for name, field in detection['fields'].items()})
+
+def _crop_detection(image, boxes):
+    """
+    Re-crop a cached detection from image
+    Returns None if the card was rectified before but can't be now
+    """
+    if boxes.get('rectified'):
+        card, transform = rectify_card(image, boxes['box'])
+        if transform is None:
+            return None
+    else:
+        x1, y1, x2, y2 = boxes['box']
+        card = image[y1:y2, x1:x2]
+    fields = {}
+    for name, field in boxes['fields'].items():
+        fx1, fy1, fx2, fy2 = field['coordinates']
+        fields[name] = dict(field, image=card[fy1:fy2, fx1:fx2])
+    return dict(boxes, card=card, fields=fields)
+
+def detection_full_resolution(full_image, image, detection):
+    """
+    Re-crop a detection made on image, a downscaled copy of full_image, from
+    full_image itself, scaling its card and field boxes up
+    Returns the detection unchanged if the card can't be rectified again
+    """
+    scale = image.shape[1] / full_image.shape[1]
+    boxes = _detection_boxes(detection)
+    boxes['box'] = _full_resolution_box(detection['box'], scale, full_image.shape)
+    boxes['fields'] = {name: dict(field, coordinates=tuple(int(v / scale) for v in field['coordinates']))
+                       for name, field in boxes['fields'].items()}
+    return _crop_detection(full_image, boxes) or detection
+
+def detect_card_and_fields_cached(image, detector=detect_card_and_fields, client=None):
+    """
+    detect_card_and_fields (or detector), reusing the boxes found in a
+    near-duplicate recent frame of the same client
+    Only boxes are cached; the card and fields are always cropped from image itself
+    """
+    key = dhash(image)
+    cached = card_and_fields_cache.get(key, scope=client)
+    if cached is not None:
+        # Wrapped so that "no card" (None) is cached too
+        if cached['boxes'] is None:
+            return None
+        detection = _crop_detection(image, cached['boxes'])
+        if detection is not None:
+            return detection
+    detection = detector(image)
+    card_and_fields_cache.set(key, {'boxes': detection and _detection_boxes(detection)}, scope=client)
+    return detection
+
+def detection_cache_stats():
+    """Return hit/miss/eviction counters of the near-duplicate frame caches"""
+    return {'card': card_cache.stats(), 'card_and_fields': card_and_fields_cache.stats()}
+
+def warm_up():
+    """Load the detector and run one dummy inference so the first request is fast"""
+    _predict(get_yolo(), np.zeros((640, 640, 3), dtype=np.uint8), verbose=False, **_predict_kwargs())
+
+@timed('decode')
+def bytes_to_cv2image(image_bytes, reduced=False):
+    """
+    Convert image bytes (or any buffer, e.g. a memoryview) to OpenCV format
+    Decodes straight from a NumPy view of the buffer, without copying it first.
+    reduced=True decodes JPEGs at half resolution, which is much cheaper.
+    """
+    flag = cv2.IMREAD_REDUCED_COLOR_2 if reduced else cv2.IMREAD_COLOR
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), flag)
+    if image is None:
+        raise ValueError("Could not decode image")
+    return image
+
+def upload_buffer(file_storage):
+    """
+    Return the bytes of an uploaded file, as a zero-copy memoryview when the
+    upload is still held in memory
+    """
+    stream = file_storage.stream
+    inner = getattr(stream, '_file', stream)  # SpooledTemporaryFile keeps a BytesIO until it rolls over
+    if hasattr(inner, 'getbuffer'):
+        return inner.getbuffer()
+    stream.seek(0)
+    return stream.read()
 
 def draw_detection_box(image, box, confidence):
     """Draw detection box on image"""
     x1, y1, x2, y2 = box
     cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0), 2)
-    cv2.putText(image, f"License: {confidence:.2f}%", (x1, y1-10), 
+    cv2.putText(image, f"License: {confidence:.2f}%", (x1, y1-10),
                cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-    return image
\ No newline at end of file
+    return image
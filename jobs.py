@@ -0,0 +1,104 @@
+import os
+import time
+import uuid
+import queue
+import logging
+from threading import Thread, Condition
+from cache_utils import TTLCache
+
+logger = logging.getLogger(__name__)
+
+class LocalBroker:
+    """
+    In-process stand-in for a Redis-style job broker
+    push()/pop() mirror LPUSH/BRPOP on a single list, so a networked broker
+    with the same two methods can be dropped in later
+    """
+
+    def __init__(self, maxsize=0):
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def push(self, job_id):
+        self._queue.put(job_id)
+
+    def pop(self, timeout=None):
+        """Return the next job id, or None if none arrives within timeout"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def qsize(self):
+        return self._queue.qsize()
+
+class JobQueue:
+    """
+    Runs submitted functions on a fixed pool of worker threads
+    Job state is kept for ttl seconds and can be polled with get() or
+    followed with wait() for server-sent events
+    """
+
+    def __init__(self, workers=None, broker=None, ttl=600, max_jobs=1000):
+        self.workers = workers or os.cpu_count() or 1
+        self.broker = broker or LocalBroker()
+        self._jobs = TTLCache(maxsize=max_jobs, ttl=ttl)
+        self._funcs = {}
+        self._changed = Condition()
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads"""
+        for i in range(self.workers):
+            thread = Thread(target=self._worker, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) and return its job id"""
+        job_id = uuid.uuid4().hex
+        self._update(job_id, {'id': job_id, 'status': 'queued', 'result': None,
+                              'error': None, 'created': time.time()})
+        self._funcs[job_id] = (func, args, kwargs)
+        self.broker.push(job_id)
+        return job_id
+
+    def get(self, job_id):
+        """Return a copy of the job's state, or None if unknown or expired"""
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    def wait(self, job_id, last_status=None, timeout=15):
+        """Block until the job's status differs from last_status, then return it"""
+        with self._changed:
+            self._changed.wait_for(
+                lambda: (self.get(job_id) or {}).get('status') != last_status, timeout)
+        return self.get(job_id)
+
+    def pending(self):
+        return self.broker.qsize()
+
+    def _update(self, job_id, job):
+        with self._changed:
+            self._jobs.set(job_id, job)
+            self._changed.notify_all()
+
+    def _worker(self):
+        while True:
+            job_id = self.broker.pop(timeout=1.0)
+            if job_id is None:
+                continue
+            func, args, kwargs = self._funcs.pop(job_id)
+            job = self.get(job_id) or {'id': job_id, 'created': time.time()}
+
+            job['status'] = 'running'
+            self._update(job_id, dict(job))
+            try:
+                job['result'] = func(*args, **kwargs)
+                job['status'] = 'done'
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {e}")
+                job['error'] = str(e)
+                job['status'] = 'failed'
+            job['finished'] = time.time()
+            self._update(job_id, job)
@@ -0,0 +1,256 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_PREFIX = 'license'
+
+# Set PROFILE_TOKEN to allow profiling single requests (see SamplingProfiler)
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL_MS', 5)) / 1000  # seconds between samples
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'logs/profiles')
+
+class Histogram:
+    """Cumulative latency histogram in the Prometheus layout"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """Returns tuple of (cumulative bucket counts, sum, count)"""
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return cumulative, total, count
+
+class MetricsRegistry:
+    """
+    Histograms and counters keyed by name and labels, rendered in the
+    Prometheus text exposition format
+    Collectors are callables returning extra (name, type, labels, value)
+    samples at scrape time, e.g. cache statistics
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = Counter()
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += amount
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        """Return every metric as Prometheus text"""
+        families = {}
+        for (name, labels), histogram in list(self._histograms.items()):
+            cumulative, total, count = histogram.snapshot()
+            lines = families.setdefault(name, ('histogram', []))[1]
+            bounds = [_format_value(b) for b in histogram.buckets] + ['+Inf']
+            for bound, value in zip(bounds, cumulative):
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {value}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        with self._lock:
+            counters = list(self._counters.items())
+        for (name, labels), value in counters:
+            families.setdefault(name, ('counter', []))[1].append(
+                f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, labels, value in samples:
+                families.setdefault(name, (kind, []))[1].append(
+                    f"{name}{_format_labels(tuple(sorted(labels.items())))} {_format_value(value)}")
+
+        output = []
+        for name, (kind, lines) in sorted(families.items()):
+            kind, help_text = self._help.get(name, (kind, ''))
+            if help_text:
+                output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {kind}")
+            output.extend(lines)
+        return '\n'.join(output) + '\n'
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+registry = MetricsRegistry()
+STAGE_SECONDS = f'{METRIC_PREFIX}_stage_duration_seconds'
+REQUEST_SECONDS = f'{METRIC_PREFIX}_http_request_duration_seconds'
+EVENTS = f'{METRIC_PREFIX}_events_total'
+registry.describe(STAGE_SECONDS, 'histogram', 'Time spent in each pipeline stage')
+registry.describe(REQUEST_SECONDS, 'histogram', 'HTTP request latency by endpoint')
+registry.describe(EVENTS, 'counter', 'Pipeline events such as OCR fallbacks and errors')
+
+# Stage timings of the request handled by the current thread
+_request = threading.local()
+
+def observe_stage(stage, seconds):
+    """Record a stage duration globally and for the current request"""
+    registry.observe(STAGE_SECONDS, seconds, stage=stage)
+    timings = getattr(_request, 'timings', None)
+    if timings is not None:
+        timings.append((stage, seconds))
+
+def count(event, amount=1, **labels):
+    """Increment the event counter"""
+    registry.inc(EVENTS, amount, event=event, **labels)
+
+class timed:
+    """
+    Time a stage, as a context manager (with timed('ocr'): ...) or a
+    decorator (@timed('ocr'))
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe_stage(self.stage, time.perf_counter() - self._start)
+        if exc_type is not None:
+            count('stage_error', stage=self.stage)
+        return False
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(self.stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+def begin_request():
+    """Start collecting stage timings for the request on this thread"""
+    _request.timings = []
+
+def end_request():
+    """Stop collecting and return the request's (stage, seconds) list"""
+    timings = getattr(_request, 'timings', None) or []
+    _request.timings = None
+    return timings
+
+def server_timing_header(timings, total=None):
+    """Format stage timings as a Server-Timing header value (milliseconds)"""
+    per_stage = {}
+    for stage, seconds in timings:
+        per_stage[stage] = per_stage.get(stage, 0.0) + seconds
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in per_stage.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ', '.join(parts)
+
+class SamplingProfiler:
+    """
+    Samples the call stack of one thread every interval seconds from a
+    background thread, without slowing the profiled code down much
+    Results are collapsed stacks (frame;frame;frame count), the input
+    format of flamegraph tools
+    """
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return '\n'.join(f"{stack} {n}" for stack, n in self.stacks.most_common()) + '\n'
+
+    def save(self, name):
+        """Write the collapsed stacks under PROFILE_DIR and return the path"""
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}_{name}.txt")
+        with open(path, 'w') as f:
+            f.write(self.collapsed())
+        return path
+
+def profiling_requested(token):
+    """Check a request's profile token against PROFILE_TOKEN (profiling is off without one)"""
+    return bool(PROFILE_TOKEN) and token == PROFILE_TOKEN
+
+def cache_collector(name, stats_fn):
+    """Collector exposing a cache's stats() dict as counters and gauges"""
+    def collect():
+        stats = stats_fn()
+        labels = {'cache': name}
+        samples = [(f'{METRIC_PREFIX}_cache_{key}_total', 'counter', labels, stats[key])
+                   for key in ('hits', 'misses', 'evictions', 'expirations') if key in stats]
+        samples += [(f'{METRIC_PREFIX}_cache_{key}', 'gauge', labels, stats[key])
+                    for key in ('size', 'maxsize', 'hit_rate') if key in stats]
+        return samples
+    return collect
@@ -0,0 +1,115 @@
+import os
+import time
+import logging
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+# Default weights and variant, overridable per deployment
+DEFAULT_WEIGHTS = os.getenv('MODEL_WEIGHTS', 'best.pt')
+DEFAULT_VARIANT = os.getenv('MODEL_VARIANT', 'fused')  # plain, fused, half or onnx
+
+_models = {}
+_stats = {}
+_locks = {}
+_registry_lock = Lock()
+
+def _current_rss():
+    """Return resident set size of this process in bytes (0 if unknown)"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def _param_bytes(model):
+    """Return size of the model parameters in bytes, if it is a torch model"""
+    try:
+        return sum(p.numel() * p.element_size() for p in model.model.parameters())
+    except Exception:
+        return 0
+
+def get_or_load(key, loader):
+    """
+    Return the object registered under key, calling loader() the first time
+    Loading happens once per process even when several threads ask at once
+    """
+    if key in _models:
+        return _models[key]
+
+    with _registry_lock:
+        lock = _locks.setdefault(key, Lock())
+
+    with lock:
+        if key not in _models:
+            rss_before = _current_rss()
+            start = time.perf_counter()
+            obj = loader()
+            load_seconds = time.perf_counter() - start
+            _stats[key] = {
+                'load_seconds': round(load_seconds, 3),
+                'rss_delta_bytes': max(_current_rss() - rss_before, 0),
+                'param_bytes': _param_bytes(obj),
+            }
+            _models[key] = obj
+            logger.info(f"Loaded {key} in {load_seconds:.2f}s")
+    return _models[key]
+
+def is_loaded(key):
+    """Check whether key has already been loaded"""
+    return key in _models
+
+def _load_yolo(weights, variant):
+    """Build a YOLO model for the requested variant"""
+    from ultralytics import YOLO
+
+    if variant == 'onnx':
+        onnx_path = os.path.splitext(weights)[0] + '.onnx'
+        if os.path.exists(onnx_path):
+            return YOLO(onnx_path, task='detect')
+        logger.warning(f"{onnx_path} not found, falling back to fused {weights}")
+        variant = 'fused'
+
+    model = YOLO(weights)
+    if variant in ('fused', 'half'):
+        try:
+            model.fuse()
+        except Exception as e:
+            logger.warning(f"Could not fuse {weights}: {e}")
+    if variant == 'half':
+        import torch
+        if torch.cuda.is_available():
+            model.model.half().to('cuda')
+        else:
+            logger.warning("Half precision needs CUDA, using float32 on CPU")
+    return model
+
+def yolo_key(weights=None, variant=None):
+    """Registry key of a YOLO weight file and variant"""
+    return f"yolo:{os.path.normpath(weights or DEFAULT_WEIGHTS)}:{variant or DEFAULT_VARIANT}"
+
+def get_yolo(weights=None, variant=None):
+    """
+    Return the shared YOLO model for a weight file
+    variant is one of plain, fused, half or onnx (defaults to MODEL_VARIANT)
+    """
+    weights = os.path.normpath(weights or DEFAULT_WEIGHTS)
+    variant = variant or DEFAULT_VARIANT
+    return get_or_load(yolo_key(weights, variant), lambda: _load_yolo(weights, variant))
+
+def export_onnx(weights=None, imgsz=640):
+    """
+    Export weights to ONNX next to the .pt file and return the new path
+    imgsz must match DETECT_IMGSZ when detecting on reduced frames
+    """
+    from ultralytics import YOLO
+    return YOLO(weights or DEFAULT_WEIGHTS).export(format='onnx', imgsz=imgsz)
+
+def model_stats():
+    """Return load time and memory footprint of every loaded model"""
+    return {key: dict(stats) for key, stats in _stats.items()}
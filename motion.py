@@ -0,0 +1,102 @@
+import cv2
+import time
+import numpy as np
+from threading import Lock
+
+class MotionGate:
+    """
+    Cheap pre-filter deciding whether a frame is worth running YOLO on
+
+    Frames are compared on a small blurred grayscale copy. Inference is
+    scheduled when enough of the scene changed, or every active_interval
+    seconds while a card-like quadrilateral is visible or a card is known to
+    be in view, so a card missed once (e.g. blurred) is retried. An unchanged
+    scene with neither is never sent to the detector (unless
+    max_idle_interval is set, as a safety refresh).
+    """
+
+    def __init__(self, change_threshold=0.02, pixel_delta=25, size=(160, 90),
+                 active_interval=0.5, max_idle_interval=None):
+        self.change_threshold = change_threshold  # fraction of pixels that must change
+        self.pixel_delta = pixel_delta  # grey-level difference counted as a change
+        self.size = size
+        self.active_interval = active_interval  # detection period while a card is present
+        self.max_idle_interval = max_idle_interval
+
+        self._reference = None
+        self._card_like = False
+        self._card_present = False
+        self._pending = False
+        self._last_run = 0.0
+        self._lock = Lock()
+        self.frames = 0
+        self.scheduled = 0
+        self.last_result = None  # last detection result, for callers that reuse it
+
+    def _prepare(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        small = cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    @staticmethod
+    def has_card_like_region(small, min_area_fraction=0.05):
+        """Look for a large convex quadrilateral in a downscaled grayscale frame"""
+        edges = cv2.Canny(small, 50, 150)
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        min_area = min_area_fraction * small.shape[0] * small.shape[1]
+        for contour in contours:
+            if cv2.contourArea(contour) < min_area:
+                continue
+            approx = cv2.approxPolyDP(contour, 0.04 * cv2.arcLength(contour, True), True)
+            if len(approx) == 4 and cv2.isContourConvex(approx):
+                return True
+        return False
+
+    def should_detect(self, frame, now=None):
+        """Return True if the detector should run on this frame"""
+        now = time.time() if now is None else now
+        small = self._prepare(frame)
+
+        with self._lock:
+            self.frames += 1
+            if self._reference is None:
+                changed = 1.0
+            else:
+                diff = cv2.absdiff(small, self._reference)
+                changed = np.count_nonzero(diff > self.pixel_delta) / diff.size
+            self._reference = small
+
+            card_like = self.has_card_like_region(small) if changed > 0 else self._card_like
+            self._card_like = card_like
+
+            since_last = now - self._last_run
+            triggered = (
+                self._pending
+                or changed >= self.change_threshold
+                or card_like
+                or self._card_present
+                or (self.max_idle_interval is not None and since_last >= self.max_idle_interval)
+            )
+            # Even a busy scene is detected at most every active_interval seconds;
+            # a change seen in between is remembered rather than dropped
+            run = triggered and since_last >= self.active_interval
+            self._pending = triggered and not run
+            if run:
+                self._last_run = now
+                self.scheduled += 1
+            return run
+
+    def report(self, card_found, result=None):
+        """Record whether the last scheduled detection found a card"""
+        with self._lock:
+            self._card_present = bool(card_found)
+            self.last_result = result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'frames': self.frames,
+                'scheduled': self.scheduled,
+                'skipped': self.frames - self.scheduled,
+                'card_present': self._card_present,
+            }
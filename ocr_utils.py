@@ -1,12 +1,62 @@
+import os
 import cv2
 import numpy as np
-from paddleocr import PaddleOCR
 import pytesseract
 import re
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from threading import Lock
 from datetime import datetime
+from model_registry import get_or_load
+from metrics import timed, count
 
-# Initialize PaddleOCR
-ocr = PaddleOCR(use_angle_cls=True, lang='en', show_log=False)
+logger = logging.getLogger(__name__)
+
+# Tesseract fallback settings
+TESSERACT_WORKERS = int(os.getenv('TESSERACT_WORKERS', os.cpu_count() or 2))
+TESSERACT_TIMEOUT = float(os.getenv('TESSERACT_TIMEOUT', 3))  # seconds per attempt
+
+# Tesseract configs tried for each field, most specific first
+ALNUM_WHITELIST = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+TESSERACT_CONFIGS = {
+    'dl_number': [f'--psm 7 -c tessedit_char_whitelist={ALNUM_WHITELIST}', '--psm 6'],
+    'valid_till': ['--psm 7 -c tessedit_char_whitelist=0123456789/-', '--psm 6'],
+    'name': ['--psm 7', '--psm 6'],
+}
+DEFAULT_TESSERACT_CONFIGS = ['--psm 6']
+
+# Patterns a cleaned field must match to be accepted
+FIELD_PATTERNS = {
+    'dl_number': re.compile(r'[A-Z]{2}\s?-?\d{2}\s?\d{11}'),
+    'valid_till': re.compile(r'\d{4}-\d{2}-\d{2}|\d{2}[-/]\d{2}[-/]\d{4}'),
+    'name': re.compile(r'[A-Za-z][A-Za-z .]{2,}'),
+}
+
+# Each worker thread only waits on its own tesseract process, so the OS runs
+# the attempts in parallel while the pool bounds how many run at once
+_tesseract_pool = ThreadPoolExecutor(max_workers=TESSERACT_WORKERS,
+                                     thread_name_prefix='tesseract')
+
+# PaddleOCR predictors are not thread-safe; verification jobs, the pipeline
+# and batch workers share one instance, so every call goes through this lock
+_ocr_lock = Lock()
+
+def _load_paddleocr():
+    """Import and initialize PaddleOCR (slow, so only done on first use)"""
+    from paddleocr import PaddleOCR
+    return PaddleOCR(use_angle_cls=True, lang='en', show_log=False)
+
+def get_ocr():
+    """Return the shared PaddleOCR instance, loading it on first call"""
+    return get_or_load('paddleocr', _load_paddleocr)
+
+def warm_up():
+    """Load PaddleOCR and run one dummy recognition so the first request is fast"""
+    dummy = np.full((48, 160, 3), 255, dtype=np.uint8)
+    cv2.putText(dummy, 'TN01', (10, 35), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+    ocr = get_ocr()
+    with _ocr_lock:
+        ocr.ocr(dummy, cls=True)
 
 def preprocess_image(image):
     """Preprocess image for better OCR results"""
@@ -22,6 +72,7 @@ def preprocess_image(image):
     
     return blurred
 
+@timed('ocr')
 def extract_text_from_image(image):
     """
     Extract text from image using PaddleOCR with fallback to Tesseract
@@ -31,7 +82,9 @@ def extract_text_from_image(image):
     processed_img = preprocess_image(image)
     
     # Try PaddleOCR first
-    result = ocr.ocr(processed_img, cls=True)
+    ocr = get_ocr()
+    with _ocr_lock:
+        result = ocr.ocr(processed_img, cls=True)
     text = ''
     
     if result and len(result) > 0 and result[0] is not None:
@@ -39,12 +92,105 @@ def extract_text_from_image(image):
         text = ' '.join([line[1][0] for line in result[0] if line[1][1] > 0.7])
     else:
         # Fallback to Tesseract
-        text = pytesseract.image_to_string(processed_img, config='--psm 6')
+        text = _run_tesseract(processed_img, '--psm 6')
     
     # Clean and format the text
     cleaned_text = clean_extracted_text(text)
     return cleaned_text
 
+@timed('ocr_batch')
+def extract_text_batch(images, use_angle_cls=False):
+    """
+    Recognize text in several field crops with a single PaddleOCR batch
+    YOLO field boxes are already tight, so text detection is skipped and
+    the angle classifier only runs when use_angle_cls is set
+    Returns dict of field name -> {'text': cleaned text, 'confidence': float}
+    """
+    names = [name for name, image in images.items() if image is not None and image.size > 0]
+    results = {name: {'text': '', 'confidence': 0.0} for name in images}
+    if not names:
+        return results
+
+    # The recognizer expects 3-channel input
+    crops = [cv2.cvtColor(preprocess_image(images[name]), cv2.COLOR_GRAY2BGR) for name in names]
+
+    ocr = get_ocr()
+    with _ocr_lock:
+        if use_angle_cls:
+            crops, _, _ = ocr.text_classifier(crops)
+        rec_res, _ = ocr.text_recognizer(crops)
+
+    failed = {}
+    for name, crop, (text, confidence) in zip(names, crops, rec_res):
+        if confidence <= 0.7:
+            failed[name] = crop
+            continue
+        results[name] = {'text': clean_extracted_text(text), 'confidence': float(confidence)}
+
+    if failed:
+        count('tesseract_fallback', amount=len(failed))
+        for name, text in tesseract_fallback(failed).items():
+            results[name] = {'text': text, 'confidence': 0.0}
+
+    return results
+
+def is_valid_field(field_name, text):
+    """Check cleaned text against the expected pattern for the field"""
+    pattern = FIELD_PATTERNS.get(field_name)
+    return bool(text) and (pattern is None or bool(pattern.search(text)))
+
+@timed('tesseract')
+def _run_tesseract(image, config):
+    """Run one tesseract attempt, returning '' if it fails or times out"""
+    try:
+        return pytesseract.image_to_string(image, config=config, timeout=TESSERACT_TIMEOUT)
+    except RuntimeError as e:
+        # pytesseract kills the process and raises RuntimeError on timeout
+        logger.warning(f"Tesseract attempt ({config}) gave up: {e}")
+        count('tesseract_timeout')
+    except Exception as e:
+        logger.error(f"Tesseract error: {e}")
+    return ''
+
+def tesseract_fallback(images):
+    """
+    Run Tesseract on several fields concurrently
+    Every config for every field is tried in the shared bounded pool; once a
+    field has a result that passes is_valid_field its other attempts are
+    cancelled. Each attempt is limited to TESSERACT_TIMEOUT seconds.
+    Returns dict of field name -> cleaned text
+    """
+    attempts = {}
+    for name, image in images.items():
+        for order, config in enumerate(TESSERACT_CONFIGS.get(name, DEFAULT_TESSERACT_CONFIGS)):
+            attempts[_tesseract_pool.submit(_run_tesseract, image, config)] = (name, order)
+
+    accepted = {}
+    candidates = {name: {} for name in images}
+    pending = set(attempts)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.cancelled():
+                continue
+            name, order = attempts[future]
+            if name in accepted:
+                continue
+            text = clean_extracted_text(future.result())
+            candidates[name][order] = text
+            if is_valid_field(name, text):
+                accepted[name] = text
+                for other in pending:
+                    if attempts[other][0] == name:
+                        other.cancel()
+
+    # Fields with no valid result keep the first non-empty attempt, in config order
+    for name in images:
+        if name not in accepted:
+            texts = [candidates[name][order] for order in sorted(candidates[name])]
+            accepted[name] = next((text for text in texts if text), '')
+    return accepted
+
 def clean_extracted_text(text):
     """Clean and format extracted text"""
     # Remove special characters except spaces, letters, numbers and basic punctuation
@@ -25,13 +25,44 @@ function initDetectionPage() {
     const proceedBtn = document.getElementById('proceed-btn');
     const recropBtn = document.getElementById('recrop-btn');
     const errorMessage = document.getElementById('error-message');
+    const deviceCamera = document.getElementById('device-camera');
+    const deviceCameraBtn = document.getElementById('device-camera-btn');
+    let frameStream = null;
+    let cropKey = null;
+    let capturePoll = null;
     
     // Event listeners
     uploadBtn.addEventListener('click', handleFileUpload);
     proceedBtn.addEventListener('click', proceedToVerification);
     recropBtn.addEventListener('click', resetDetection);
+    if (deviceCameraBtn) {
+        deviceCameraBtn.addEventListener('click', startDeviceCamera);
+    }
+    watchStreamCaptures();
     
     // Functions
+    function watchStreamCaptures() {
+        // Cards captured from the server camera are offered to this page by key
+        stopWatchingStreamCaptures();
+        capturePoll = setInterval(() => {
+            fetch('/stream_capture')
+            .then(response => response.json())
+            .then(data => {
+                if (capturePoll && data.detected) {
+                    showDetectionResult(data);
+                }
+            })
+            .catch(() => {});
+        }, 1000);
+    }
+    
+    function stopWatchingStreamCaptures() {
+        if (capturePoll) {
+            clearInterval(capturePoll);
+            capturePoll = null;
+        }
+    }
+    
     function handleFileUpload() {
         if (fileInput.files.length === 0) {
             showError('Please select an image file');
@@ -58,7 +89,32 @@ function initDetectionPage() {
         });
     }
     
+    function startDeviceCamera() {
+        // Stream this device's camera to the server instead of using its webcam
+        if (!navigator.mediaDevices) {
+            showError('This browser cannot stream its camera');
+            return;
+        }
+        navigator.mediaDevices.getUserMedia({ video: { facingMode: 'environment' } })
+        .then(stream => {
+            stopWatchingStreamCaptures();
+            deviceCamera.srcObject = stream;
+            deviceCamera.style.display = 'block';
+            videoFeed.style.display = 'none';
+            deviceCameraBtn.style.display = 'none';
+            frameStream = streamFrames(deviceCamera, data => {
+                stream.getTracks().forEach(track => track.stop());
+                showDetectionResult(data);
+            });
+        })
+        .catch(error => {
+            showError('Camera unavailable: ' + error.message);
+        });
+    }
+    
     function showDetectionResult(data) {
+        stopWatchingStreamCaptures();
+        cropKey = data.crop_key || null;
         croppedImage.src = data.cropped_image;
         confidenceValue.textContent = data.confidence.toFixed(2);
         detectionResult.style.display = 'block';
@@ -66,13 +122,18 @@ function initDetectionPage() {
     }
     
     function proceedToVerification() {
-        window.location.href = '/verify';
+        // Crops found from live frames aren't in the session yet
+        window.location.href = cropKey ? '/verify?crop=' + encodeURIComponent(cropKey) : '/verify';
     }
     
     function resetDetection() {
         detectionResult.style.display = 'none';
         uploadForm.style.display = 'block';
         fileInput.value = '';
+        cropKey = null;
+        if (videoFeed.style.display !== 'none') {
+            watchStreamCaptures();
+        }
     }
     
     function showError(message) {
@@ -84,6 +145,109 @@ function initDetectionPage() {
     }
 }
 
+function tabClientId() {
+    // Identifies this tab to /detect_frame, so kiosks behind one address don't share state
+    let id = sessionStorage.getItem('clientId');
+    if (!id) {
+        id = Math.random().toString(36).slice(2) + Date.now().toString(36);
+        sessionStorage.setItem('clientId', id);
+    }
+    return id;
+}
+
+function streamFrames(video, onDetected, maxWidth = 640, quality = 0.7, stillQuality = 0.95) {
+    // Send downscaled JPEG frames over a WebSocket, one at a time: the next
+    // frame is only captured once the server has answered the previous one.
+    // Once the server sees a card it asks for one full-resolution still to crop it from.
+    // Falls back to posting frames to /detect_frame without WebSocket support
+    const canvas = document.createElement('canvas');
+    let socket = null;
+    let opened = false;
+    let stopped = false;
+    let sendStill = false;
+    
+    function sendFrame() {
+        if (stopped || (socket && socket.readyState !== WebSocket.OPEN)) {
+            return;
+        }
+        if (!video.videoWidth) {
+            setTimeout(sendFrame, 100);  // camera not started yet
+            return;
+        }
+        const still = sendStill;
+        const scale = still ? 1 : Math.min(1, maxWidth / video.videoWidth);
+        canvas.width = Math.round(video.videoWidth * scale);
+        canvas.height = Math.round(video.videoHeight * scale);
+        canvas.getContext('2d').drawImage(video, 0, 0, canvas.width, canvas.height);
+        canvas.toBlob(blob => {
+            if (!blob || stopped) {
+                return;
+            }
+            if (socket) {
+                if (socket.readyState === WebSocket.OPEN) {
+                    socket.send(blob);
+                }
+            } else {
+                postFrame(blob, still);
+            }
+        }, 'image/jpeg', still ? stillQuality : quality);
+    }
+    
+    function postFrame(blob, still) {
+        const formData = new FormData();
+        formData.append('frame', blob, 'frame.jpg');
+        formData.append('client_id', tabClientId());
+        formData.append(still ? 'still' : 'stills', '1');
+        fetch('/detect_frame', { method: 'POST', body: formData })
+        .then(response => response.json())
+        .then(handleReply)
+        .catch(() => setTimeout(sendFrame, 1000));
+    }
+    
+    function handleReply(data) {
+        if (data.status === 'success' && data.detected) {
+            stop();
+            onDetected(data);
+            return;
+        }
+        if (data.status === 'success') {
+            // A still that was rejected as busy is sent again
+            sendStill = Boolean(data.send_still);
+        }
+        // Back off while the server is busy, otherwise send the next frame straight away
+        setTimeout(sendFrame, data.status === 'success' ? 0 : 500);
+    }
+    
+    function stop() {
+        stopped = true;
+        if (socket) {
+            socket.close();
+        }
+    }
+    
+    if (window.WebSocket) {
+        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        socket = new WebSocket(`${protocol}//${window.location.host}/ws/frames`);
+        socket.addEventListener('open', () => {
+            opened = true;
+            sendFrame();
+        });
+        socket.addEventListener('message', event => handleReply(JSON.parse(event.data)));
+        socket.addEventListener('close', () => {
+            if (!opened && !stopped) {
+                socket = null;  // the server has no WebSocket endpoint
+                sendFrame();
+            } else {
+                stopped = true;
+            }
+        });
+    } else {
+        sendFrame();
+    }
+    
+    return { stop: stop };
+}
+
 function initVerificationPage() {
     // Elements
     const verifyForm = document.getElementById('verify-form');
@@ -94,13 +258,7 @@ function initVerificationPage() {
     extractLicenseDetails();
     
     function extractLicenseDetails() {
-        fetch('/verify', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            }
-        })
-        .then(response => response.json())
+        runVerificationJob()
         .then(data => {
             if (data.status === 'success') {
                 displayExtractedData(data.license_data);
@@ -134,14 +292,7 @@ function initVerificationPage() {
             valid_till: document.getElementById('valid-till').value
         };
         
-        fetch('/verify', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify(formData)
-        })
-        .then(response => response.json())
+        runVerificationJob(formData)
         .then(data => {
             if (data.status === 'success') {
                 window.location.href = '/result';
@@ -155,6 +306,64 @@ function initVerificationPage() {
     }
 }
 
+function runVerificationJob(formData) {
+    // Queue a verification job, then wait for its result over server-sent
+    // events (or by polling when EventSource isn't available)
+    return fetch('/verify', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: formData ? JSON.stringify(formData) : undefined
+    })
+    .then(response => response.json())
+    .then(job => {
+        if (job.status !== 'queued') {
+            return job;
+        }
+        const waitForResult = window.EventSource ? followJobEvents(job) : pollJobStatus(job);
+        // Fetch the final status so the result is stored in the session
+        return waitForResult.then(() => fetch(job.status_url)).then(response => response.json());
+    });
+}
+
+function followJobEvents(job) {
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(job.events_url);
+        source.addEventListener('done', () => {
+            source.close();
+            resolve();
+        });
+        source.addEventListener('failed', () => {
+            source.close();
+            resolve();
+        });
+        source.addEventListener('error', () => {
+            source.close();
+            // Fall back to polling if the stream drops
+            pollJobStatus(job).then(resolve, reject);
+        });
+    });
+}
+
+function pollJobStatus(job, interval = 500) {
+    return new Promise((resolve, reject) => {
+        function poll() {
+            fetch(job.status_url)
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'pending') {
+                    setTimeout(poll, interval);
+                } else {
+                    resolve(data);
+                }
+            })
+            .catch(reject);
+        }
+        poll();
+    });
+}
+
 function initResultPage() {
     // Get data from hidden elements or session
     const successResult = document.getElementById('success-result');
@@ -1,7 +1,7 @@
-from db_utils import get_connection
+from db_utils import get_db_connection
 
 try:
-    conn = get_connection()
+    conn = get_db_connection()
     print("✅ Connected to MySQL successfully!")
     conn.close()
 except Exception as e:
@@ -0,0 +1,126 @@
+import cv2
+import numpy as np
+from collections import deque
+from threading import Lock
+
+def sharpness(image):
+    """Variance of the Laplacian; low values mean a blurred image"""
+    if image is None or image.size == 0:
+        return 0.0
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+def box_iou(a, b):
+    """Intersection over union of two (x1, y1, x2, y2) boxes"""
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+class CardTracker:
+    """
+    Follows a detected card between detector runs using Lucas-Kanade optical
+    flow on corner features inside the box
+
+    seed() is called with each YOLO detection; update() moves the box on
+    every frame by the median motion (and scale change) of the tracked points.
+    stability() turns the recent box history into a 0..1 steadiness score.
+    """
+
+    def __init__(self, history=8, min_points=8, max_motion=0.02):
+        self.min_points = min_points
+        self.max_motion = max_motion  # centre movement per frame, as a fraction of the box diagonal
+        self._history = deque(maxlen=history)
+        self._gray = None
+        self._points = None
+        self._box = None
+        self._lock = Lock()
+
+    def seed(self, frame, box):
+        """
+        Start tracking box, as detected in frame
+        The steadiness history is kept if box overlaps the tracked box, so a
+        card that stays put builds up stability across detector runs
+        """
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        x1, y1, x2, y2 = box
+        mask = np.zeros_like(gray)
+        mask[max(y1, 0):max(y2, 0), max(x1, 0):max(x2, 0)] = 255
+        points = cv2.goodFeaturesToTrack(gray, maxCorners=100, qualityLevel=0.01,
+                                         minDistance=5, mask=mask)
+        with self._lock:
+            same_card = self._box is not None and box_iou(self._box, box) >= 0.5
+            self._gray = gray
+            self._points = points
+            self._box = tuple(float(v) for v in box)
+            if not same_card:
+                self._history.clear()
+            self._history.append(self._box)
+
+    def reset(self):
+        with self._lock:
+            self._gray = self._points = self._box = None
+            self._history.clear()
+
+    def update(self, frame):
+        """Propagate the box to frame; returns the new box or None if lost"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        with self._lock:
+            if self._box is None or self._points is None or len(self._points) < self.min_points:
+                self._gray = gray
+                return None
+
+            new_points, status, _ = cv2.calcOpticalFlowPyrLK(self._gray, gray, self._points, None)
+            good_old = self._points[status.flatten() == 1].reshape(-1, 2)
+            good_new = new_points[status.flatten() == 1].reshape(-1, 2)
+            self._gray = gray
+            if len(good_new) < self.min_points:
+                self._box = self._points = None
+                self._history.clear()
+                return None
+
+            dx, dy = np.median(good_new - good_old, axis=0)
+            # Scale from the change in spread of the points around their centre
+            old_spread = np.median(np.linalg.norm(good_old - good_old.mean(axis=0), axis=1))
+            new_spread = np.median(np.linalg.norm(good_new - good_new.mean(axis=0), axis=1))
+            scale = new_spread / old_spread if old_spread > 0 else 1.0
+
+            x1, y1, x2, y2 = self._box
+            cx, cy = (x1 + x2) / 2 + dx, (y1 + y2) / 2 + dy
+            half_w, half_h = (x2 - x1) / 2 * scale, (y2 - y1) / 2 * scale
+            self._box = (cx - half_w, cy - half_h, cx + half_w, cy + half_h)
+            self._points = good_new.reshape(-1, 1, 2)
+            self._history.append(self._box)
+            return self.box_ints(self._box)
+
+    @staticmethod
+    def box_ints(box):
+        return tuple(int(round(v)) for v in box)
+
+    @property
+    def box(self):
+        with self._lock:
+            return None if self._box is None else self.box_ints(self._box)
+
+    def stability(self):
+        """
+        Score in [0, 1]: 1 when the box hasn't moved over the history window,
+        0 when it moves max_motion of its diagonal per frame or more
+        """
+        with self._lock:
+            history = list(self._history)
+        if len(history) < 2:
+            return 0.0
+        boxes = np.array(history)
+        centres = np.column_stack(((boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2))
+        diagonal = np.hypot(boxes[-1, 2] - boxes[-1, 0], boxes[-1, 3] - boxes[-1, 1]) or 1.0
+        motion = np.linalg.norm(np.diff(centres, axis=0), axis=1).max() / diagonal
+        return float(max(0.0, 1.0 - motion / self.max_motion))
+
+    def is_steady(self, min_frames=None, min_stability=0.5):
+        """True once the box has been tracked over a full, steady history window"""
+        with self._lock:
+            frames = len(self._history)
+        min_frames = min_frames or self._history.maxlen
+        return frames >= min_frames and self.stability() >= min_stability
@@ -1,11 +1,11 @@
 import torch
-from ultralytics import YOLO
+from model_registry import get_yolo
 
 # Allow safe globals
 torch.serialization.add_safe_globals([torch.nn.Module, 'ultralytics.nn.tasks.DetectionModel'])
 
 # Load YOLOv8 model (ensure the path to your model is correct)
-model = YOLO('runs/detect/train5/weights/best.pt')  # Update with your path
+model = get_yolo('runs/detect/train5/weights/best.pt')  # Update with your path
 
 def detect_card(frame):
     results = model(frame)  # Inference
@@ -0,0 +1,260 @@
+import cv2
+import time
+import queue
+import logging
+from threading import Thread, Condition, Event, Lock
+from image_utils import detect_card_and_fields, draw_detection_box
+from tracking import sharpness
+
+logger = logging.getLogger(__name__)
+
+class VideoPipeline:
+    """
+    Camera pipeline split into capture, inference and encoder threads, so the
+    stream runs at camera speed rather than model speed
+
+    - capture keeps only the newest frame, dropping anything not yet consumed
+    - inference runs on the newest frame at its own pace and publishes boxes
+    - an optional tracker follows the card on every frame between detections,
+      and detections are only handed on once the card is steady and sharp
+    - an optional capture window scores those detections and passes only the
+      best of every few to on_detection
+    - the encoder overlays the last known box on each frame, JPEG-encodes it
+      once and fans the bytes out to every subscribed viewer
+    """
+
+    def __init__(self, source=0, width=1280, height=720, detection_interval=0.0,
+                 box_ttl=1.0, on_detection=None, client_queue_size=2, gate=None,
+                 tracker=None, min_sharpness=100.0, capture_window=None,
+                 detector=detect_card_and_fields):
+        self.source = source
+        self.width = width
+        self.height = height
+        self.detection_interval = detection_interval  # minimum seconds between inferences
+        self.box_ttl = box_ttl  # how long a box stays on screen after its detection
+        self.on_detection = on_detection  # called with each detection dict from the inference thread
+
+        self._camera = None
+        self._frame = None
+        self._frame_id = 0
+        self._frame_cond = Condition()
+        self._detection = None
+        self._detection_lock = Lock()
+        self.client_queue_size = client_queue_size  # frames buffered per viewer before dropping
+        self.gate = gate  # optional MotionGate deciding which frames reach the detector
+        self.tracker = tracker  # optional CardTracker moving the box between detections
+        self.min_sharpness = min_sharpness  # Laplacian variance a crop needs before it is used
+        self.capture_window = capture_window  # optional CaptureWindow picking the best crop
+        self.detector = detector  # returns a detect_card_and_fields style dict or None
+        self._subscribers = set()
+        self._subscribers_lock = Lock()
+        self._stop = Event()
+        self._threads = []
+
+    def start(self):
+        """Open the camera and start the capture, inference and encoder threads"""
+        self._camera = cv2.VideoCapture(self.source)
+        self._camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self._camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if not self._camera.isOpened():
+            raise RuntimeError(f"Could not open camera {self.source}")
+
+        self._stop.clear()
+        self._threads = [
+            Thread(target=self._capture_loop, name='capture', daemon=True),
+            Thread(target=self._inference_loop, name='inference', daemon=True),
+            Thread(target=self._encode_loop, name='encoder', daemon=True),
+        ]
+        if self.tracker is not None:
+            self._threads.append(Thread(target=self._track_loop, name='tracker', daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """Stop the threads and release the camera"""
+        self._stop.set()
+        with self._frame_cond:
+            self._frame_cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+        if self._camera is not None:
+            self._camera.release()
+            self._camera = None
+
+    @property
+    def running(self):
+        return bool(self._threads) and not self._stop.is_set()
+
+    def _capture_loop(self):
+        while not self._stop.is_set():
+            success, frame = self._camera.read()
+            if not success:
+                logger.error("Camera read failed, stopping capture")
+                break
+            with self._frame_cond:
+                # Overwrite rather than queue: stale frames are simply dropped
+                self._frame = frame
+                self._frame_id += 1
+                self._frame_cond.notify_all()
+        self._stop.set()
+        with self._frame_cond:
+            self._frame_cond.notify_all()
+
+    def wait_for_frame(self, last_id, timeout=1.0):
+        """
+        Block until a frame newer than last_id is captured
+        Returns tuple of (frame_id, frame), frame is None on timeout or stop
+        """
+        with self._frame_cond:
+            self._frame_cond.wait_for(
+                lambda: self._frame_id != last_id or self._stop.is_set(), timeout)
+            if self._frame_id == last_id or self._frame is None:
+                return last_id, None
+            return self._frame_id, self._frame
+
+    def _inference_loop(self):
+        last_id = 0
+        while not self._stop.is_set():
+            started = time.time()
+            last_id, frame = self.wait_for_frame(last_id)
+            if frame is None:
+                continue
+            if self.gate is not None and not self.gate.should_detect(frame):
+                continue
+
+            try:
+                detection = self.detector(frame)
+            except Exception as e:
+                logger.error(f"Detection error: {e}")
+                detection = None
+            if self.gate is not None:
+                self.gate.report(detection is not None)
+
+            if detection is not None:
+                detection['time'] = time.time()
+                with self._detection_lock:
+                    self._detection = detection
+                candidate = detection if self._ready_to_crop(frame, detection) else None
+                if candidate is not None and self.capture_window is not None:
+                    candidate = self.capture_window.add(candidate, frame.shape)
+                if candidate is not None and self.on_detection is not None:
+                    try:
+                        self.on_detection(candidate)
+                    except Exception as e:
+                        logger.error(f"Detection callback error: {e}")
+            else:
+                if self.tracker is not None:
+                    self.tracker.reset()
+                if self.capture_window is not None:
+                    self.capture_window.clear()
+
+            remaining = self.detection_interval - (time.time() - started)
+            if remaining > 0:
+                self._stop.wait(remaining)
+
+    def _ready_to_crop(self, frame, detection):
+        """Seed the tracker and decide whether the card is steady and sharp enough to crop"""
+        if self.tracker is None:
+            return True
+        self.tracker.seed(frame, detection['box'])
+        detection['stability'] = self.tracker.stability()
+        detection['sharpness'] = sharpness(detection['card'])
+        return self.tracker.is_steady() and detection['sharpness'] >= self.min_sharpness
+
+    def _track_loop(self):
+        last_id = 0
+        while not self._stop.is_set():
+            last_id, frame = self.wait_for_frame(last_id)
+            if frame is not None:
+                self.tracker.update(frame)
+
+    def latest_detection(self):
+        """Return the most recent detection, or None if it is older than box_ttl"""
+        with self._detection_lock:
+            detection = self._detection
+        if detection is None or time.time() - detection['time'] > self.box_ttl:
+            return None
+        return detection
+
+    def _encode_loop(self):
+        last_id = 0
+        while not self._stop.is_set():
+            last_id, frame = self.wait_for_frame(last_id)
+            if frame is None:
+                continue
+
+            with self._subscribers_lock:
+                subscribers = list(self._subscribers)
+            if not subscribers:
+                continue
+
+            detection = self.latest_detection()
+            if detection is not None:
+                tracked_box = self.tracker.box if self.tracker is not None else None
+                frame = draw_detection_box(frame.copy(), tracked_box or detection['box'],
+                                           detection['confidence'])
+
+            ret, buffer = cv2.imencode('.jpg', frame)
+            if not ret:
+                continue
+            frame_bytes = buffer.tobytes()
+
+            for client in subscribers:
+                self._offer(client, frame_bytes)
+
+        # Wake every viewer so its generator can finish
+        with self._subscribers_lock:
+            for client in self._subscribers:
+                self._offer(client, None)
+
+    @staticmethod
+    def _offer(client, item):
+        """Queue item for a viewer, discarding its oldest frame if it is falling behind"""
+        while True:
+            try:
+                client.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    client.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def subscribe(self):
+        """Register a viewer and return its bounded frame queue"""
+        client = queue.Queue(maxsize=self.client_queue_size)
+        with self._subscribers_lock:
+            self._subscribers.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self._subscribers_lock:
+            self._subscribers.discard(client)
+
+    def viewer_count(self):
+        with self._subscribers_lock:
+            return len(self._subscribers)
+
+    def frames(self, client=None):
+        """
+        Yield the shared JPEG-encoded frames for one viewer
+        client is a queue from subscribe(), which the caller then unsubscribes;
+        without one the viewer is subscribed for as long as the generator runs
+        """
+        subscribed = client is None
+        if subscribed:
+            client = self.subscribe()
+        try:
+            while not self._stop.is_set():
+                try:
+                    frame_bytes = client.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                if frame_bytes is None:
+                    break
+                yield frame_bytes
+        finally:
+            if subscribed:
+                self.unsubscribe(client)
@@ -0,0 +1,69 @@
+import os
+import logging
+from threading import Thread, Lock
+import image_utils
+import ocr_utils
+from model_registry import is_loaded, yolo_key
+
+logger = logging.getLogger(__name__)
+
+# Set WARMUP_ON_START=0 to load models lazily on the first request instead
+WARMUP_ON_START = os.getenv('WARMUP_ON_START', '1') != '0'
+
+# Each heavy model and the function that loads it and runs a dummy inference
+WARMUP_TASKS = {
+    'detector': image_utils.warm_up,
+    'ocr': ocr_utils.warm_up,
+}
+
+# Registry check for each model, used when warm-up is disabled
+LOADED_CHECKS = {
+    'detector': lambda: is_loaded(yolo_key()),
+    'ocr': lambda: is_loaded('paddleocr'),
+}
+
+_status = {name: 'pending' for name in WARMUP_TASKS}
+_status_lock = Lock()
+_thread = None
+
+def _set_status(name, status):
+    with _status_lock:
+        _status[name] = status
+
+def _run_warmup(tasks):
+    """Load every model in turn, recording its readiness"""
+    for name, task in tasks.items():
+        _set_status(name, 'loading')
+        try:
+            task()
+            _set_status(name, 'ready')
+        except Exception as e:
+            logger.error(f"Warm-up of {name} failed: {e}")
+            _set_status(name, 'failed')
+
+def start_warmup(tasks=None):
+    """
+    Start the background warm-up thread once per process
+    tasks can replace the WARMUP_TASKS functions, e.g. to wait for worker processes
+    """
+    global _thread
+    tasks = dict(WARMUP_TASKS, **(tasks or {}))
+    with _status_lock:
+        if _thread is not None:
+            return _thread
+        _thread = Thread(target=_run_warmup, args=(tasks,), name='model-warmup', daemon=True)
+    _thread.start()
+    return _thread
+
+def readiness():
+    """
+    Report warm-up state of each model
+    Without a warm-up thread models load on first use, so the service is
+    ready and each model is reported as 'ready' or 'lazy' (not loaded yet)
+    Returns tuple of (all_ready: bool, statuses: dict)
+    """
+    with _status_lock:
+        if _thread is None:
+            return True, {name: 'ready' if check() else 'lazy' for name, check in LOADED_CHECKS.items()}
+        statuses = dict(_status)
+    return all(s == 'ready' for s in statuses.values()), statuses
@@ -0,0 +1,316 @@
+import os
+import time
+import uuid
+import queue
+import logging
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import Future
+from threading import Thread, Lock, Event
+import numpy as np
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Set INFERENCE_BACKEND=process to run detection and OCR in worker processes
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'thread')
+SLOT_BYTES = 1920 * 1080 * 3  # largest frame that fits a preallocated slot
+SLOTS_PER_WORKER = 4
+WORKER_READY_TIMEOUT = float(os.getenv('WORKER_READY_TIMEOUT', 300))  # seconds to wait for a warm-up
+LIVENESS_INTERVAL = 1.0  # seconds between worker liveness checks
+
+def _partition_cores():
+    """Split the usable cores between the detection and OCR processes"""
+    try:
+        cores = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = list(range(os.cpu_count() or 1))
+    if len(cores) < 2:
+        return cores, cores
+    half = len(cores) // 2
+    return cores[:half], cores[half:]
+
+def _limit_threads(cpus, threads):
+    """Pin this process to cpus and cap the intra-op thread pools to threads"""
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'CPU_NUM'):
+        os.environ[var] = str(threads)
+    if hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            logger.warning(f"Could not pin worker to cores {cpus}: {e}")
+
+def _attach(descriptor):
+    """Return (shared memory, ndarray view) for a frame descriptor"""
+    name, shape, dtype = descriptor
+    # Spawned workers share the parent's resource tracker, so attaching here
+    # doesn't make the segment's lifetime depend on this process
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+def _detect(frame, payload):
+    from image_utils import detect_card_and_fields
+    detection = detect_card_and_fields(frame, rectify=False)
+    if detection is None:
+        return None
+    # Only boxes travel back; the caller crops (and rectifies) from its own copy of the frame
+    return {
+        'confidence': detection['confidence'],
+        'box': detection['box'],
+        'fields': {name: field['coordinates'] for name, field in detection['fields'].items()}
+    }
+
+def _read_fields(card, payload):
+    from image_utils import crop_fields
+    from card_layout import extract_fields
+    from ocr_utils import extract_text_batch
+    field_boxes = payload.get('field_boxes')
+    fields = crop_fields(card, field_boxes) if field_boxes else extract_fields(card)[0]
+    return extract_text_batch({name: field['image'] for name, field in fields.items()})
+
+def _warm_detection():
+    import torch
+    from image_utils import warm_up
+    torch.set_num_threads(int(os.environ['OMP_NUM_THREADS']))
+    warm_up()
+
+def _warm_ocr():
+    from ocr_utils import warm_up
+    warm_up()
+
+# Task handler and warm-up function for each kind of worker
+WORKER_KINDS = {
+    'detection': (_detect, _warm_detection),
+    'ocr': (_read_fields, _warm_ocr),
+}
+
+def _worker_main(kind, tasks, results, cpus, threads):
+    """Entry point of a worker process"""
+    _limit_threads(cpus, threads)
+    handler, warm = WORKER_KINDS[kind]
+    try:
+        warm()
+        results.put(('ready', kind, None))
+    except Exception as e:
+        results.put(('ready', kind, f"warm-up failed: {e}"))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, descriptor, payload = task
+        shm = frame = None
+        try:
+            shm, frame = _attach(descriptor)
+            results.put((task_id, handler(frame, payload), None))
+        except Exception as e:
+            results.put((task_id, None, str(e)))
+        finally:
+            # Drop the view first; a segment can't be closed while it is exported
+            frame = None
+            if shm is not None:
+                shm.close()
+
+class _SlotPool:
+    """Preallocated shared-memory buffers frames are copied into, reused across tasks"""
+
+    def __init__(self, count, size):
+        self.size = size
+        self._slots = [shared_memory.SharedMemory(create=True, size=size) for _ in range(count)]
+        self._free = list(range(count))
+        self._lock = Lock()
+
+    def put(self, array):
+        """
+        Copy array into a free slot (or a one-off segment if none fits)
+        Returns tuple of (descriptor, release callable)
+        """
+        array = np.ascontiguousarray(array)
+        slot = None
+        if array.nbytes <= self.size:
+            with self._lock:
+                slot = self._free.pop() if self._free else None
+
+        if slot is not None:
+            shm = self._slots[slot]
+            release = lambda: self._give_back(slot)
+        else:
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            release = lambda: (shm.close(), shm.unlink())
+
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        return (shm.name, array.shape, array.dtype.str), release
+
+    def _give_back(self, slot):
+        with self._lock:
+            self._free.append(slot)
+
+    def close(self):
+        for shm in self._slots:
+            shm.close()
+            shm.unlink()
+
+class InferencePool:
+    """
+    Dedicated detection and OCR processes, each pinned to its own share of
+    the cores with matching intra-op thread counts
+
+    Frames are handed over through shared memory instead of being pickled,
+    and only compact results (boxes, text) come back.
+    """
+
+    def __init__(self, detection_threads=None, ocr_threads=None):
+        detection_cores, ocr_cores = _partition_cores()
+        self._config = {
+            'detection': (detection_cores, detection_threads or len(detection_cores)),
+            'ocr': (ocr_cores, ocr_threads or len(ocr_cores)),
+        }
+        self._ctx = mp.get_context('spawn')
+        self._results = self._ctx.Queue()
+        self._tasks = {}
+        self._processes = {}
+        self._slots = {}
+        self._pending = {}
+        self._pending_lock = Lock()
+        self._ready = {kind: Event() for kind in WORKER_KINDS}
+        self._errors = {}
+        self._stopping = False
+
+    def start(self):
+        for kind, (cpus, threads) in self._config.items():
+            self._tasks[kind] = self._ctx.Queue()
+            self._slots[kind] = _SlotPool(SLOTS_PER_WORKER, SLOT_BYTES)
+            process = self._ctx.Process(target=_worker_main, name=f'{kind}-worker', daemon=True,
+                                        args=(kind, self._tasks[kind], self._results, cpus, threads))
+            process.start()
+            self._processes[kind] = process
+            logger.info(f"Started {kind} worker on cores {cpus} with {threads} threads")
+        Thread(target=self._dispatch_results, name='inference-results', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopping = True
+        for kind, tasks in self._tasks.items():
+            tasks.put(None)
+        for process in self._processes.values():
+            process.join(timeout=5)
+        for slots in self._slots.values():
+            slots.close()
+
+    def wait_ready(self, kind, timeout=WORKER_READY_TIMEOUT):
+        """Block until a worker has warmed up; raises if its warm-up failed or timed out"""
+        if not self._ready[kind].wait(timeout):
+            raise TimeoutError(f"{kind} worker not ready after {timeout}s")
+        if kind in self._errors:
+            raise RuntimeError(self._errors[kind])
+
+    def _dispatch_results(self):
+        last_check = time.monotonic()
+        while True:
+            try:
+                message = self._results.get(timeout=LIVENESS_INTERVAL)
+            except queue.Empty:
+                message = None
+            if time.monotonic() - last_check >= LIVENESS_INTERVAL:
+                self._check_workers()
+                last_check = time.monotonic()
+            if message is None:
+                continue
+            task_id, result, error = message
+            if task_id == 'ready':
+                if error:
+                    self._errors[result] = error
+                self._ready[result].set()
+                continue
+            with self._pending_lock:
+                future, release, kind = self._pending.pop(task_id, (None, None, None))
+            if future is None:
+                continue
+            release()
+            if error:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(result)
+
+    def _check_workers(self):
+        """Fail the pending tasks of any worker process that has died"""
+        for kind, process in self._processes.items():
+            if process.is_alive():
+                continue
+            error = f"{kind} worker exited with code {process.exitcode}"
+            if kind not in self._errors:
+                self._errors[kind] = error
+                if not self._stopping:
+                    logger.error(error)
+            self._ready[kind].set()  # wake wait_ready() callers
+            with self._pending_lock:
+                lost = [(task_id, entry) for task_id, entry in self._pending.items() if entry[2] == kind]
+                for task_id, _ in lost:
+                    del self._pending[task_id]
+            for _, (future, release, _) in lost:
+                release()
+                future.set_exception(RuntimeError(error))
+
+    def submit(self, kind, array, payload=None):
+        """Send array to a worker of the given kind; returns a Future"""
+        process = self._processes[kind]
+        if not process.is_alive():
+            raise RuntimeError(f"{kind} worker exited with code {process.exitcode}")
+        descriptor, release = self._slots[kind].put(array)
+        task_id = uuid.uuid4().hex
+        future = Future()
+        with self._pending_lock:
+            self._pending[task_id] = (future, release, kind)
+        self._tasks[kind].put((task_id, descriptor, payload or {}))
+        return future
+
+    @timed('detect_card_and_fields')
+    def detect_card_and_fields(self, image, timeout=30):
+        """Same result as image_utils.detect_card_and_fields, computed in the detection worker"""
+        from image_utils import crop_fields, rectify_detection, RECTIFY_CARD
+        detection = self.submit('detection', image).result(timeout)
+        if detection is None:
+            return None
+        x1, y1, x2, y2 = detection['box']
+        card = image[y1:y2, x1:x2]
+        detection['card'] = card
+        detection['fields'] = crop_fields(card, detection['fields'])
+        if RECTIFY_CARD:
+            detection = rectify_detection(image, detection)
+        return detection
+
+    def detect_license_card(self, image, timeout=30):
+        """Same result as image_utils.detect_license_card, computed in the detection worker"""
+        detection = self.detect_card_and_fields(image, timeout)
+        if detection is None:
+            return None, 0, (0, 0, 0, 0)
+        return detection['card'], detection['confidence'], detection['box']
+
+    @timed('ocr_worker')
+    def read_fields(self, card, field_boxes=None, timeout=60):
+        """OCR the fields of a card crop in the OCR worker, like ocr_utils.extract_text_batch"""
+        return self.submit('ocr', card, {'field_boxes': field_boxes}).result(timeout)
+
+_pool = None
+_pool_lock = Lock()
+
+def get_inference_pool():
+    """Return the process pool when INFERENCE_BACKEND=process, else None"""
+    global _pool
+    # Under spawn, `python app.py` re-imports the app in every worker as
+    # __mp_main__; workers must never start workers of their own
+    if INFERENCE_BACKEND != 'process' or mp.parent_process() is not None:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = InferencePool(
+                detection_threads=int(os.getenv('DETECTION_THREADS', 0)) or None,
+                ocr_threads=int(os.getenv('OCR_THREADS', 0)) or None,
+            ).start()
+    return _pool
+
+def stop_inference_pool():
+    """Stop the worker processes, if get_inference_pool() started them"""
+    with _pool_lock:
+        if _pool is not None:
+            _pool.stop()
@@ -1,5 +1,5 @@
 import cv2
-from ultralytics import YOLO
+from model_registry import get_yolo
 from paddleocr import PaddleOCR
 from datetime import datetime
 import re
@@ -8,7 +8,7 @@ import re
 classes = ['license_card', 'dl_number', 'name', 'valid_till']
 
 # Load model
-model = YOLO('best.pt')
+model = get_yolo('best.pt')
 
 # Load image
 image_path = 'sample_license.jpg'
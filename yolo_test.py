@@ -1,9 +1,9 @@
-from ultralytics import YOLO
 import cv2
 import time
+from model_registry import get_yolo
 
 # Load YOLOv8 model
-model = YOLO('best.pt')  # Your trained model
+model = get_yolo('best.pt')  # Your trained model
 
 # Setup webcam
 cap = cv2.VideoCapture(0)